@@ -0,0 +1,238 @@
+import collections
+import json
+import logging
+import os
+import time
+from datetime import date
+from os.path import expanduser
+
+from gymnoscamera import predictors
+from gymnoscamera.frame_buffers import LetterboxInput
+from gymnoscamera.yolo_network_tflite.compare import match_people
+
+CACHE_LOCATION = expanduser("~") + '/.gymnos_camera/autotune.json'
+DEFAULT_INPUT_SIZES = (224, 256, 320, 416)
+
+# A model file run at one square input size, None for backends without one, with how it did on this box
+OperatingPoint = collections.namedtuple('OperatingPoint',
+                                        ['model_type', 'model_path', 'input_size', 'latency', 'accuracy'])
+
+
+def capture_frames(get_frame, count: int = 30, timeout: float = 30):
+    """
+    Takes frames from a camera to tune on
+
+    :param get_frame: the camera's get_frame
+    :param count: number of frames to take
+    :param timeout: seconds to keep trying for while the camera has no frames
+    :return: list of frames
+    """
+    frames = []
+    deadline = time.time() + timeout
+    while len(frames) < count and time.time() < deadline:
+        image, _ = get_frame()
+        if image is None:
+            time.sleep(0.05)
+            continue
+        frames.append(image.copy())
+
+    return frames
+
+
+class AutoTuner:
+    """
+    Picks the model and input size a box runs at by benchmarking every
+    candidate on the box itself.
+
+    Every model file is run at every input size over the same frames. Each
+    model is loaded once when its backend can change the input size between
+    frames, otherwise it is loaded again for each size, and only run at its
+    own size if the backend does not take one. The first model at the
+    largest size is the reference the others are scored against, as the F1
+    of the people they find matched to the reference's.
+    The chosen operating point is the fastest one which meets the accuracy
+    target within the latency budget. When nothing fits the budget the
+    fastest one meeting the target is used anyway.
+
+    The result is kept in a cache file, so later starts with the same models
+    and settings skip the benchmark.
+    """
+
+    def __init__(self, model_type: str, model_paths: list, input_sizes: tuple = DEFAULT_INPUT_SIZES,
+                 latency_budget: float = 0.2, accuracy_target: float = 0.9, cache_path: str = CACHE_LOCATION):
+        """
+        :param model_type: type of every model, one of the registered detectors
+        :param model_paths: model files to choose from, the most accurate first
+        :param input_sizes: square network input sizes to try
+        :param latency_budget: most seconds a frame may take
+        :param accuracy_target: least F1 against the reference
+        :param cache_path: file to keep the chosen operating points in
+        """
+        self.model_type = model_type
+        self.model_paths = [os.path.abspath(model_path) for model_path in model_paths]
+        self.input_sizes = sorted(input_sizes)
+        self.latency_budget = latency_budget
+        self.accuracy_target = accuracy_target
+        self.cache_path = cache_path
+
+    def get_cache_key(self):
+        """
+        Returns the key of this tuning in the cache file. Changing a model
+        file changes the key.
+        """
+        models = ["{}@{}".format(model_path, int(os.path.getmtime(model_path))) for model_path in self.model_paths]
+        return "{}|{}|{}|{}|{}".format(self.model_type, ",".join(models), ",".join(map(str, self.input_sizes)),
+                                       self.latency_budget, self.accuracy_target)
+
+    def read_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as cache_file:
+                return json.load(cache_file)
+        except ValueError as e:
+            logging.info("Ignoring unreadable autotune cache: " + str(e))
+            return {}
+
+    def get_cached(self):
+        """
+        Returns the operating point chosen by an earlier run, None if there is none
+        """
+        entry = self.read_cache().get(self.get_cache_key())
+        if entry is None:
+            return None
+
+        if entry['input_size'] is not None:
+            entry['input_size'] = tuple(entry['input_size'])
+        return OperatingPoint(**{field: entry[field] for field in OperatingPoint._fields})
+
+    def save(self, operating_point: OperatingPoint):
+        cache = self.read_cache()
+        entry = operating_point._asdict()
+        entry['tuned_on'] = str(date.today())
+        cache[self.get_cache_key()] = entry
+
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump(cache, cache_file, indent=2)
+
+    def benchmark(self, predictor, frames: list, network_input: LetterboxInput = None):
+        """
+        Runs one candidate over the frames
+
+        :param predictor: the loaded model
+        :param network_input: LetterboxInput at the candidate's input size, None for the model's own
+        :return: (list of people coordinates, mean seconds per frame)
+        """
+        # The first frame includes one-off setup
+        predictor.run_prediction(frames[0], network_input)
+
+        results = []
+        start = time.perf_counter()
+        for frame in frames:
+            results.append(predictor.run_prediction(frame, network_input))
+
+        return results, (time.perf_counter() - start) / len(frames)
+
+    def benchmark_model(self, model_path: str, frames: list):
+        """
+        Runs a model at every input size it can take, largest first
+
+        :return: list of (input size, list of people coordinates, mean seconds per frame)
+        """
+        runs = []
+        if predictors.get_capabilities(self.model_type).resizable_input:
+            predictor = predictors.Predictors(self.model_type, model_path)
+            try:
+                for input_size in reversed(self.input_sizes):
+                    network_input = LetterboxInput(input_size, input_size)
+                    runs.append(((input_size, input_size),) + self.benchmark(predictor, frames, network_input))
+            finally:
+                predictor.close()
+            return runs
+
+        for input_size in reversed(self.input_sizes):
+            predictor = predictors.Predictors(self.model_type, model_path, (input_size, input_size))
+            try:
+                model_size = predictor.get_input_size()
+                if model_size is not None:
+                    model_size = tuple(model_size)
+                if model_size != (input_size, input_size):
+                    # The model runs at its own size whatever it is given
+                    logging.info("Autotune skipping input sizes for {}, it only runs at {}"
+                                 .format(os.path.basename(model_path), model_size))
+                    return [(model_size,) + self.benchmark(predictor, frames)]
+                runs.append(((input_size, input_size),) + self.benchmark(predictor, frames))
+            finally:
+                predictor.close()
+
+        return runs
+
+    def get_accuracy(self, reference_results, results):
+        """
+        Returns the F1 of the people found against the reference's
+        """
+        matched = 0
+        found = 0
+        for reference, candidates in zip(reference_results, results):
+            matched += len(match_people(reference, candidates))
+            found += len(reference) + len(candidates)
+
+        if found == 0:
+            return 1.0
+        return 2.0 * matched / found
+
+    def tune(self, frames: list):
+        """
+        Benchmarks every candidate and saves the chosen operating point
+
+        :param frames: frames from this camera to tune on
+        :return: the chosen OperatingPoint
+        """
+        if not frames:
+            raise ValueError("No frames to autotune on")
+
+        logging.info("Autotuning {} models at input sizes {} on {} frames"
+                     .format(len(self.model_paths), self.input_sizes, len(frames)))
+
+        reference_results = None
+        points = []
+        for model_path in self.model_paths:
+            # Largest size first, so the first model's largest size is the reference
+            for input_size, results, latency in self.benchmark_model(model_path, frames):
+                if reference_results is None:
+                    reference_results = results
+                point = OperatingPoint(self.model_type, model_path, input_size, latency,
+                                       self.get_accuracy(reference_results, results))
+                logging.info("Autotune {} at {}: {:.1f} ms, F1 {:.3f}"
+                             .format(os.path.basename(model_path), input_size, latency * 1000, point.accuracy))
+                points.append(point)
+
+        accurate = [point for point in points if point.accuracy >= self.accuracy_target]
+        within_budget = [point for point in accurate if point.latency <= self.latency_budget]
+        if not within_budget:
+            logging.info("No operating point meets the {:.0f} ms budget, using the fastest accurate one"
+                         .format(self.latency_budget * 1000))
+            within_budget = accurate
+
+        chosen = min(within_budget, key=lambda point: point.latency)
+        logging.info("Autotune chose " + str(chosen))
+        self.save(chosen)
+
+        return chosen
+
+    def get_operating_point(self, get_frames):
+        """
+        Returns the cached operating point, tuning first if there is none
+
+        :param get_frames: called for the frames to tune on, only when tuning
+        :return: OperatingPoint
+        """
+        operating_point = self.get_cached()
+        if operating_point is not None:
+            logging.info("Using autotuned " + str(operating_point))
+            return operating_point
+
+        return self.tune(get_frames())
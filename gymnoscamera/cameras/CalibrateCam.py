@@ -179,6 +179,9 @@ class CalibrateCam:
     def main(self):
         while True:
             img, _ = self.camera.get_frame()
+            if img is None:
+                cv2.waitKey(50)
+                continue
             img_temp = img
 
             if self.p1 and self.p2:
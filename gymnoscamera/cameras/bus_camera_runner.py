@@ -0,0 +1,91 @@
+import logging
+import multiprocessing
+
+from gymnoscamera.cameras.camera import Camera
+from gymnoscamera.frame_bus import SharedFrameRing, run_capture_process
+
+
+class BusCameraRunner(Camera):
+    """
+    An implementation of a Camera runner which captures from another camera
+    type in a separate process.
+
+    The capture process writes frames into a shared memory ring and only
+    sends their sequence number and capture time over a pipe, so decoding
+    never competes with inference for this interpreter. Frames are handed out
+    zero-copy and stay valid until the next call to get_frame, the pipelined
+    loop copies them out through capture_frame.
+
+    When the capture process' camera stops, get_frame raises what it raised,
+    ReplayFinished at the end of a replay.
+    """
+    def __init__(self, model_type: str, model_path: str, predictor=None, machine_ids=None,
+                 capture_size=None, source_type: str = 'ip', source_args: dict = None,
+                 frame_timeout: float = 5):
+        """
+        :param source_type: type of camera the capture process runs
+        :param source_args: extra arguments for the capture process' camera runner
+        :param frame_timeout: seconds to wait for a frame before giving up on the capture process
+        """
+        super().__init__(model_type, model_path, predictor, machine_ids, capture_size)
+
+        self.frame_timeout = frame_timeout
+        self.last_sequence = 0
+        self.dropped = 0
+
+        self.ring = SharedFrameRing((self.camera_height, self.camera_width, 3))
+        self.connection, child_connection = multiprocessing.Pipe(duplex=False)
+
+        # The capture process has to produce frames the size of the ring
+        source_args = dict(source_args or {}, capture_size=self.get_dimensions())
+        self.capture_process = multiprocessing.Process(
+            target=run_capture_process,
+            args=(source_type, source_args, self.ring.name, self.ring.shape, self.ring.lock, child_connection),
+            name="capture_process")
+        self.capture_process.daemon = True
+        self.capture_process.start()
+        child_connection.close()
+
+        logging.info("Capturing from '{}' camera in process {}".format(source_type, self.capture_process.pid))
+
+    def get_frame(self):
+        """
+        Retrieves the latest frame from the capture process and returns it
+        """
+        connection = self.connection
+        while True:
+            if not connection.poll(self.frame_timeout):
+                raise RuntimeError("No frame from the capture process in {} seconds".format(self.frame_timeout))
+
+            # Only the latest frame matters, skip the metadata of older ones
+            try:
+                while connection.poll():
+                    metadata = connection.recv()
+                    if isinstance(metadata, Exception):
+                        # The capture process' camera stopped
+                        raise metadata
+            except EOFError:
+                raise RuntimeError("The capture process stopped")
+
+            # The capture process' camera is down
+            if metadata is None:
+                return self.no_frame()
+
+            sequence, image, frame_time = self.ring.acquire_latest()
+            if image is not None and sequence > self.last_sequence:
+                break
+
+        self.dropped += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+
+        return image, frame_time
+
+    def close(self):
+        """
+        Stops the capture process and frees the frame ring
+        """
+        self.capture_process.terminate()
+        self.capture_process.join()
+        self.connection.close()
+        self.ring.close()
+        logging.info("Capture process stopped, {} frames were skipped".format(self.dropped))
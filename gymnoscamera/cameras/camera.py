@@ -6,42 +6,94 @@ import cv2
 from gymnos_firestore import machines
 from gymnos_firestore.machines import MACHINE_COLLECTION
 import logging
+import queue
 
-from gymnoscamera import machine, predictors
+from gymnoscamera import machine, predictors, status_publisher
+from gymnoscamera.frame_buffers import FrameBufferPool, measure_allocations
+from gymnoscamera.motion_gate import MotionGate
+from gymnoscamera.roi_predictor import RoiPredictor
+from gymnoscamera.pipeline import FramePipeline
+from gymnoscamera.result_cache import CachedPredictor, ResultCache
+from gymnoscamera.station_set import StationSet
+from gymnoscamera.tracker import PeopleTracker
 
 JSON_LOCATION = "../gym_info.json"
+DEFAULT_CAPTURE_SIZE = (256, 256)  # width, height
+OCCUPANCY_KEY = "occupancy"
+OCCUPANCY_DEFAULT_KEY = "default"
+NO_FRAME_DELAY = 0.05  # seconds to wait before asking again when the camera had no frame
 
 
 class Camera(ABC):
 
-    def __init__(self, model_type:str, model_path: str):
+    def __init__(self, model_type:str, model_path: str, predictor: predictors.Predictors = None,
+                 machine_ids: list = None, capture_size: tuple = None):
         """
         Initialize the camera, predictor and stations
         :param model_path:
+        :param predictor: an already loaded predictor to share instead of loading a new one,
+                          without either a model type or a predictor the camera only captures
+        :param machine_ids: only use the configured machines with these ids
+        :param capture_size: (width, height) of the frames the camera produces,
+                             independent of the network input size
         """
         self.headless_mode = False
         self.view_only = False
+        self.pipelined = False
+        self.motion_gate = None
+        self.tracker = None
+        self.result_cache = None
 
         # initialize general camera params
-        self.camera_height = 256
-        self.camera_width = 256
+        (self.camera_width, self.camera_height) = tuple(capture_size or DEFAULT_CAPTURE_SIZE)
 
         self.check_in_period = 60
 
         # initialize the Predictor
-        self.predictor = predictors.Predictors(model_type, model_path)
+        if predictor is None and model_type is not None:
+            predictor = predictors.Predictors(model_type, model_path)
+        self.set_predictor(predictor)
+
+        # the last frame at the resolution it was captured at, and the one of the frame being predicted on
+        self.native_frame = None
+        self.prediction_native_frame = None
+        self.keep_native_frame = False
+
+        # set while the camera is down, reconnect_supervisor is set by runners which reconnect
+        self.frames_missing = False
+        self.last_frame_cap_time = None
+        self.reconnect_supervisor = None
 
         # initialize stations
+        self.machine_ids = machine_ids
         self.stations = []
+        self.station_set = None
         self.set_stations()
 
+    def set_predictor(self, predictor: predictors.Predictors):
+        """
+        Sets the predictor the camera runs, None to only capture
+
+        :param predictor: loaded predictor
+        """
+        self.predictor = predictor
+
+        # reusable buffers for the frame path, with a letterboxed input for models which take one
+        input_size = None
+        if predictor is not None and predictor.capabilities.input_dtype == 'float32':
+            input_size = predictor.get_input_size()
+        self.frame_pool = FrameBufferPool(self.camera_width, self.camera_height, input_size)
+
     def set_stations(self):
         """
         Set the machine stations for this camera
         :return:
         """
+        occupancy = self.get_occupancy_config()
         for station in self.get_configured_machines():
-            self.stations.append(machine.Machine(station, self.camera_width, self.camera_height))
+            self.stations.append(machine.Machine(station, self.camera_width, self.camera_height,
+                                                 occupancy.get(station.id, occupancy.get(OCCUPANCY_DEFAULT_KEY))))
+        self.station_set = StationSet(self.stations)
         logging.info("Stations used: " + str(self.get_configured_machines()))
 
     def get_configured_machines(self):
@@ -61,10 +113,26 @@ class Camera(ABC):
                 machine_model.name = machine_data[machines.MACHINE_NAME]
                 machine_model.location = machine_data[machines.MACHINE_LOC]
 
+                if self.machine_ids is not None and machine_model.id not in self.machine_ids:
+                    continue
                 stations.append(machine_model)
 
         return stations
 
+    def get_occupancy_config(self):
+        """
+        Retrieves how a person counts as using each machine from the JSON file,
+        under "occupancy" keyed by machine id or "default" for every other machine:
+        {"default": {"policy": "overlap", "threshold": 0.6},
+         "<machine id>": {"policy": "foot_point", "polygon": [[0.1, 0.5], [0.4, 0.5], [0.4, 0.9], [0.1, 0.9]]}}
+
+        :return: {machine id: occupancy dict}
+        """
+        with open(os.path.join(os.path.dirname(__file__), JSON_LOCATION)) as json_file:
+            data = json.load(json_file)
+
+        return data.get(OCCUPANCY_KEY, {})
+
     def get_dimensions(self):
         """
         Returns width and height of the camera
@@ -77,26 +145,24 @@ class Camera(ABC):
         """
         This main loop tracks machine usage
         """
-        draw_people = self.draw_people
-        draw_machines = self.draw_machines
+        if self.pipelined:
+            self.run_pipelined_loop()
+            return
+
+        account_frame = self.account_frame
+        detect_people = self.detect_people
         get_frame = self.get_frame
         show_feed = cv2.imshow
 
         while True:
             # Retrieve a frame and timestamp it
             image, frame_cap_time = get_frame()
+            if image is None:
+                time.sleep(NO_FRAME_DELAY)
+                continue
 
-            if int(frame_cap_time) % self.check_in_period == 0:
-                logging.info("Camera checking in")
-
-            if not self.view_only:
-                people_coords = draw_people(image)
-
-                # Calculate station usage
-                for station in self.stations:
-                    station.increment_machine_time(people_coords, frame_cap_time)
-
-            draw_machines(image)
+            people_coords = detect_people(image, frame_cap_time)
+            account_frame(image, frame_cap_time, people_coords)
 
             if not self.headless_mode:
                 show_feed("Video Feed", image)
@@ -105,6 +171,176 @@ class Camera(ABC):
                 if cv2.waitKey(1) == ord('q'):
                     break
 
+    def run_pipelined_loop(self):
+        """
+        This main loop tracks machine usage while capture and inference
+        run on their own threads. This thread is the accounting stage.
+        """
+        account_frame = self.account_frame
+        show_feed = cv2.imshow
+
+        pipeline = FramePipeline(self.capture_frame, self.detect_people, no_frame_delay=NO_FRAME_DELAY)
+        pipeline.start()
+
+        try:
+            while True:
+                try:
+                    image, frame_cap_time, _, people_coords = pipeline.get_result(timeout=1.0)
+                except queue.Empty:
+                    continue
+
+                account_frame(image, frame_cap_time, people_coords)
+
+                if not self.headless_mode:
+                    show_feed("Video Feed", image)
+
+                    # Press 'q' to quit
+                    if cv2.waitKey(1) == ord('q'):
+                        break
+        finally:
+            pipeline.stop()
+
+    def capture_frame(self):
+        """
+        Retrieves a frame which stays valid while later frames are captured,
+        for the pipelined loop. The camera reuses its frame buffers, so the
+        frame and its native frame are copied out of them.
+
+        :return: (image, frame_cap_time, native_frame), image is None when the camera has no frame
+        """
+        image, frame_cap_time = self.get_frame()
+        if image is None:
+            return None, frame_cap_time, None
+
+        native_frame = None
+        if self.keep_native_frame and self.native_frame is not None:
+            native_frame = self.native_frame.copy()
+        return image.copy(), frame_cap_time, native_frame
+
+    def detect_people(self, image, frame_cap_time, native_frame=None):
+        """
+        Finds the people in a frame, skipping the predictor when the
+        motion gate finds nothing has changed or the tracker can follow
+        the people on its own
+
+        :param image: frame we will run predictions on
+        :param frame_cap_time: The exact time the frame was captured on
+        :param native_frame: the frame at the resolution it was captured at, defaults to the last one captured
+        :return: list of the coordinates of each person
+        """
+        if self.view_only:
+            return []
+
+        self.prediction_native_frame = native_frame if native_frame is not None else self.native_frame
+
+        if not self.needs_prediction(image, frame_cap_time):
+            return self.get_skipped_prediction()
+
+        people_coords = self.predictor.run_prediction(image, self.frame_pool.network_input)
+
+        return self.update_prediction(people_coords)
+
+    def needs_prediction(self, image, frame_cap_time):
+        """
+        Checks whether the predictor has to run on this frame
+        """
+        if self.tracker is not None:
+            self.tracker.predict()
+            if not self.tracker.should_detect():
+                if self.motion_gate is not None:
+                    # The tracker skipped the frame for the gate
+                    self.motion_gate.record_skip()
+                return False
+
+        if self.motion_gate is None:
+            return True
+        if self.motion_gate.should_predict(image, frame_cap_time):
+            return True
+
+        if self.tracker is not None:
+            # Nothing changed, so the last detections still hold
+            self.tracker.update(self.motion_gate.last_coords)
+        return False
+
+    def get_skipped_prediction(self):
+        """
+        Returns the people on a frame the predictor was skipped on
+        """
+        if self.tracker is not None:
+            return self.tracker.get_coords()
+        return self.motion_gate.last_coords
+
+    def update_prediction(self, people_coords):
+        """
+        Records the people found by the predictor for frames it is skipped on
+
+        :param people_coords: coordinates the predictor found
+        :return: coordinates of each person, as tracked when tracking
+        """
+        if self.motion_gate is not None:
+            self.motion_gate.update(people_coords)
+        if self.tracker is not None:
+            return self.tracker.update(people_coords)
+        return people_coords
+
+    def account_frame(self, image, frame_cap_time, people_coords):
+        """
+        Updates station usage with the people found in a frame and draws
+        the results onto it
+
+        :param image: frame the people were found in
+        :param frame_cap_time: The exact time the frame was captured on
+        :param people_coords: coordinates of each person in the frame
+        """
+        if self.frames_missing:
+            self.resume_stations(frame_cap_time)
+        self.last_frame_cap_time = frame_cap_time
+
+        if int(frame_cap_time) % self.check_in_period == 0:
+            logging.info("Camera checking in")
+            if self.motion_gate is not None:
+                self.motion_gate.log_stats()
+            if self.tracker is not None:
+                self.tracker.log_stats()
+            if self.result_cache is not None:
+                self.result_cache.log_stats()
+            if self.reconnect_supervisor is not None:
+                self.reconnect_supervisor.log_stats()
+            status_publisher.publisher.log_stats()
+
+        if not self.view_only:
+            self.draw_boxes(image, people_coords)
+
+            # Calculate station usage
+            self.station_set.increment_machine_time(people_coords, frame_cap_time)
+
+        self.draw_machines(image)
+
+    def no_frame(self):
+        """
+        The result of get_frame while the camera is down. Station timers
+        are frozen until frames come back.
+
+        :return: (None, current time)
+        """
+        self.frames_missing = True
+        return None, time.time()
+
+    def resume_stations(self, frame_cap_time):
+        """
+        Freezes the station timers over the time the camera had no frames
+
+        :param frame_cap_time: The exact time the first frame after the outage was captured on
+        """
+        self.frames_missing = False
+        if self.last_frame_cap_time is None:
+            return
+
+        outage = frame_cap_time - self.last_frame_cap_time
+        logging.info("Frames resumed after {:.1f} seconds".format(outage))
+        for station in self.stations:
+            station.pause(outage)
+
     def set_view_only(self):
         logging.info("Setting view only mode")
         self.view_only = True
@@ -115,6 +351,65 @@ class Camera(ABC):
         logging.info("Setting headless mode")
         self.headless_mode = True
 
+    def set_motion_gated(self):
+        logging.info("Setting motion gated mode")
+        self.motion_gate = MotionGate(self.stations)
+
+    def set_tracking(self):
+        logging.info("Setting tracking mode")
+        self.tracker = PeopleTracker()
+
+    def set_roi_inference(self, native_resolution: bool = False):
+        """
+        Runs the predictor only on the regions around the stations
+
+        :param native_resolution: crop the regions out of the frame at the resolution it was captured at
+        """
+        logging.info("Setting ROI inference mode, native resolution: " + str(native_resolution))
+        self.keep_native_frame = native_resolution
+        get_native_frame = self.get_native_frame if native_resolution else None
+        self.predictor = RoiPredictor(self.predictor, self.stations, self.camera_width, self.camera_height,
+                                      get_native_frame=get_native_frame)
+
+    def set_result_cache(self, max_distance: int = 8, max_age: float = 60):
+        """
+        Reuses the people found on earlier frames for frames which look the same
+
+        :param max_distance: most bits the frame hashes may differ by
+        :param max_age: seconds a result is reused for before the predictor runs again
+        """
+        logging.info("Setting result cache, max distance: {}, max age: {}".format(max_distance, max_age))
+        self.result_cache = ResultCache(max_distance=max_distance, max_age=max_age)
+        self.predictor = CachedPredictor(self.predictor, self.result_cache)
+
+    def check_frame_allocations(self, frames: int = 100):
+        """
+        Measures the heap memory capturing and preparing a frame allocates
+        in steady state, the model itself is not included
+
+        :param frames: number of frames to measure
+        :return: (most bytes allocated at once, bytes retained per frame)
+        """
+        frame_pool = self.frame_pool
+        get_frame = self.get_frame
+
+        def step():
+            image, _ = get_frame()
+            if image is not None:
+                frame_pool.get_input_tensor(image)
+
+        return measure_allocations(step, frames)
+
+    def get_native_frame(self):
+        """
+        Returns the frame being predicted on at the resolution it was captured at
+        """
+        return self.prediction_native_frame
+
+    def set_pipelined(self):
+        logging.info("Setting pipelined mode")
+        self.pipelined = True
+
     def get_time(self):
         """
         Retrieves the time in seconds since epoch
@@ -124,6 +419,14 @@ class Camera(ABC):
     def get_frame(self):
         """
         Retrieves a frames from the camera and returns it
+
+        :return: (image, frame_cap_time), image is None when the camera has no frame
+        """
+        pass
+
+    def close(self):
+        """
+        Releases what the camera holds beyond this process, runners which hold anything override this
         """
         pass
 
@@ -134,13 +437,22 @@ class Camera(ABC):
         :param image: frame we will run predictions on
         :return: list of the coordinates of each person our model detects
         """
-        rectanglefy = cv2.rectangle
         list_of_coords = self.predictor.run_prediction(image)
-        for (topX, leftY, bottomX, rightY) in list_of_coords:
-            rectanglefy(image, (topX, leftY), (bottomX, rightY), (0, 0, 255), 2)
+        self.draw_boxes(image, list_of_coords)
 
         return list_of_coords
 
+    def draw_boxes(self, image, list_of_coords):
+        """
+        Draws bounding boxes around each of the coordinates provided
+
+        :param image: frame to draw on
+        :param list_of_coords: coordinates of each person
+        """
+        rectanglefy = cv2.rectangle
+        for (topX, leftY, bottomX, rightY) in list_of_coords:
+            rectanglefy(image, (topX, leftY), (bottomX, rightY), (0, 0, 255), 2)
+
     def draw_machines(self, image):
         """
         Draws bounding boxes around each station
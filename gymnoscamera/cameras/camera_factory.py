@@ -3,16 +3,25 @@ class CameraFactory:
     Returns an initialized implementation of a camera class, provided it has been registered.
     """
 
-    def get_camera(self, camera_type: str, model_type: str, model_path: str):
+    def get_camera(self, camera_type: str, model_type: str, model_path: str, **kwargs):
+        """
+        :param kwargs: extra arguments for the camera runner, such as a shared predictor
+        """
         if camera_type == 'usb':
             from gymnoscamera.cameras.usb_camera_runner import UsbCameraRunner
-            return UsbCameraRunner(model_type, model_path)
+            return UsbCameraRunner(model_type, model_path, **kwargs)
         elif camera_type == 'pi':
             from gymnoscamera.cameras.pi_camera_runner import PiCameraRunner
-            return PiCameraRunner(model_type, model_path)
+            return PiCameraRunner(model_type, model_path, **kwargs)
         elif camera_type == 'ip':
             from gymnoscamera.cameras.ip_camera_runner import IpCameraRunner
-            return IpCameraRunner(model_type, model_path)
+            return IpCameraRunner(model_type, model_path, **kwargs)
+        elif camera_type == 'bus':
+            from gymnoscamera.cameras.bus_camera_runner import BusCameraRunner
+            return BusCameraRunner(model_type, model_path, **kwargs)
+        elif camera_type in ('file', 'replay'):
+            from gymnoscamera.cameras.replay_camera_runner import ReplayCameraRunner
+            return ReplayCameraRunner(model_type, model_path, **kwargs)
         else:
             raise ValueError(camera_type)
 
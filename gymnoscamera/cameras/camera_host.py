@@ -0,0 +1,151 @@
+import json
+import logging
+import time
+
+import cv2
+
+from gymnoscamera import predictors
+from gymnoscamera.cameras import camera_factory
+from gymnoscamera.cameras.camera import NO_FRAME_DELAY
+
+CAMERAS_KEY = 'cameras'
+CAMERA_TYPE_KEY = 'type'
+INPUT_SIZE_KEY = 'input_size'
+
+
+class CameraHost:
+    """
+    Runs several cameras in one process with a single shared predictor.
+
+    Every tick a frame is taken from each camera, all of the frames are run
+    through the predictor in one batch and the results are handed back to
+    each camera for station accounting.
+
+    The config file is JSON of the form:
+    {
+        "input_size": [320, 320],
+        "cameras": [
+            {"type": "ip", "url": "rtsp://...", "machine_ids": ["..."]},
+            {"type": "usb", "device": 1, "capture_size": [640, 480]}
+        ]
+    }
+    "input_size" is the optional (width, height) of the shared network input.
+    Any camera key other than "type" is passed to the camera runner.
+    """
+
+    def __init__(self, config_path: str, model_type: str, model_path: str):
+        """
+        :param config_path: path to the cameras config file
+        :param model_type: type of model shared by every camera
+        :param model_path: path to the model shared by every camera
+        """
+        self.headless_mode = False
+        self.view_only = False
+
+        config = self.read_config(config_path)
+        self.predictor = predictors.Predictors(model_type, model_path, config.get(INPUT_SIZE_KEY))
+
+        self.cameras = []
+        for camera_config in config[CAMERAS_KEY]:
+            camera_config = dict(camera_config)
+            camera_type = camera_config.pop(CAMERA_TYPE_KEY)
+            camera = camera_factory.factory.get_camera(camera_type, model_type, model_path,
+                                                       predictor=self.predictor, **camera_config)
+            self.cameras.append(camera)
+
+        logging.info("Hosting {} cameras".format(len(self.cameras)))
+
+    def read_config(self, config_path: str):
+        """
+        Reads the cameras config file
+
+        :param config_path: path to the cameras config file
+        :return: config dict
+        """
+        with open(config_path) as config_file:
+            data = json.load(config_file)
+
+        if not data.get(CAMERAS_KEY):
+            raise ValueError("No cameras configured in '{}'".format(config_path))
+
+        return data
+
+    def set_view_only(self):
+        logging.info("Setting view only mode")
+        self.view_only = True
+        for camera in self.cameras:
+            camera.set_view_only()
+
+    def set_motion_gated(self):
+        for camera in self.cameras:
+            camera.set_motion_gated()
+
+    def set_tracking(self):
+        for camera in self.cameras:
+            camera.set_tracking()
+
+    def set_result_cache(self, max_distance: int = 8, max_age: float = 60):
+        for camera in self.cameras:
+            camera.set_result_cache(max_distance, max_age)
+
+    def set_headless(self):
+        logging.info("Setting headless mode")
+        self.headless_mode = True
+        for camera in self.cameras:
+            camera.set_headless()
+
+    def run_loop(self):
+        """
+        This main loop tracks machine usage on every camera
+        """
+        run_prediction_batch = self.predictor.run_prediction_batch
+        show_feed = cv2.imshow
+
+        while True:
+            # Retrieve a frame from every camera and timestamp them
+            frames = [camera.get_frame() for camera in self.cameras]
+            images = [image for image, _ in frames]
+
+            # Cameras which are down have no frame this tick
+            ready = [i for i, image in enumerate(images) if image is not None]
+            if not ready:
+                time.sleep(NO_FRAME_DELAY)
+                continue
+
+            batch_coords = [[] for _ in images]
+            if not self.view_only:
+                # Only the cameras which need it go through the predictor
+                pending = [i for i in ready if self.cameras[i].needs_prediction(*frames[i])]
+                for i in ready:
+                    if i not in pending:
+                        batch_coords[i] = self.cameras[i].get_skipped_prediction()
+
+                # Frames their camera has a result cached for skip the batch
+                predicted = {}
+                for i in pending:
+                    result_cache = self.cameras[i].result_cache
+                    if result_cache is not None:
+                        people_coords = result_cache.lookup(images[i])
+                        if people_coords is not None:
+                            predicted[i] = people_coords
+
+                misses = [i for i in pending if i not in predicted]
+                if misses:
+                    for i, people_coords in zip(misses, run_prediction_batch([images[i] for i in misses])):
+                        if self.cameras[i].result_cache is not None:
+                            self.cameras[i].result_cache.store(people_coords)
+                        predicted[i] = people_coords
+
+                for i in pending:
+                    batch_coords[i] = self.cameras[i].update_prediction(predicted[i])
+
+            for i in ready:
+                image, frame_cap_time = frames[i]
+                self.cameras[i].account_frame(image, frame_cap_time, batch_coords[i])
+
+                if not self.headless_mode:
+                    show_feed("Video Feed {}".format(i), image)
+
+            # Press 'q' to quit
+            if not self.headless_mode and cv2.waitKey(1) == ord('q'):
+                break
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+
+
+class FrameGrabber:
+    """
+    Continuously reads from a cv2.VideoCapture on a background thread and keeps
+    only the latest decoded frame.
+
+    Each frame is stamped with a sequence number, its wall clock capture time
+    (used for machine accounting) and a monotonic capture time (used to measure
+    staleness), so readers never wait on a decode.
+
+    Two frame buffers are swapped between the decoder and readers, so readers
+    have to copy the frame out through the copy callable, which runs while the
+    buffer is locked.
+
+    The grabber owns the capture and releases it when its thread exits, so a
+    read still blocked when the grabber is stopped never has the capture
+    released from under it.
+    """
+
+    def __init__(self, capture):
+        """
+        :param capture: an opened cv2.VideoCapture
+        """
+        self.capture = capture
+
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+        self.frame_time = 0.0
+        self.frame_monotonic = 0.0
+
+        self.running = False
+        self.worker = None
+
+    def start(self):
+        """
+        Starts the grabber thread
+        """
+        self.running = True
+        self.worker = threading.Thread(target=self.update_stream, name="frame_grabber")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self, timeout: float = 1.0):
+        """
+        Stops the grabber thread, which releases the capture once its current read returns
+
+        :param timeout: seconds to wait for the thread to finish
+        """
+        self.running = False
+        if self.worker is not None:
+            self.worker.join(timeout)
+            if self.worker.is_alive():
+                logging.info("Frame grabber still reading, it releases the stream once the read returns")
+
+    def update_stream(self):
+        try:
+            self.read_frames()
+        finally:
+            self.capture.release()
+
+    def read_frames(self):
+        spare = None
+        failed_reads = 0
+        while self.running:
+            ret, image = self.capture.read(spare)
+            if not ret:
+                # Only the start and end of an outage are logged
+                if failed_reads == 0:
+                    logging.info("Frame grabber failed to read a frame")
+                failed_reads += 1
+                time.sleep(0.1)
+                continue
+            if failed_reads:
+                logging.info("Frame grabber reading again after {} failed reads".format(failed_reads))
+                failed_reads = 0
+
+            frame_time = time.time()
+            frame_monotonic = time.monotonic()
+            with self.condition:
+                # The previous frame is decoded into next
+                spare = self.frame
+                self.frame = image
+                self.sequence += 1
+                self.frame_time = frame_time
+                self.frame_monotonic = frame_monotonic
+                self.condition.notify_all()
+
+    def copy_latest(self, copy, *args):
+        image = self.frame
+        if image is not None:
+            image = copy(image, *args)
+        return self.sequence, image, self.frame_time, self.frame_monotonic
+
+    def get_latest(self, copy, *args):
+        """
+        Copies out the latest frame without waiting on the stream
+
+        :param copy: callable taking (frame, *args) and returning a copy of the frame
+        :return: (sequence, image, frame_time, frame_monotonic), image is None
+                 until the first frame has been decoded
+        """
+        with self.condition:
+            return self.copy_latest(copy, *args)
+
+    def wait_for_newer(self, sequence: int, timeout: float, copy, *args):
+        """
+        Waits until a frame newer than the given sequence number is available
+        and copies it out
+
+        :param sequence: last sequence number the caller has seen
+        :param timeout: seconds to wait, None waits forever
+        :param copy: callable taking (frame, *args) and returning a copy of the frame
+        :return: (sequence, image, frame_time, frame_monotonic)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > sequence, timeout)
+            return self.copy_latest(copy, *args)
+
+    def get_staleness(self):
+        """
+        Returns how many seconds old the latest frame is
+        """
+        with self.condition:
+            return time.monotonic() - self.frame_monotonic
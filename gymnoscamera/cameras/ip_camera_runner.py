@@ -1,64 +1,94 @@
 import cv2
 import time
-from threading import Thread, Lock
-import numpy as np
 import logging
 
 from gymnoscamera.cameras.camera import Camera
+from gymnoscamera.cameras.frame_grabber import FrameGrabber
+from gymnoscamera.cameras.reconnect import ReconnectSupervisor
 
 user = 'admin'
 password = 'MZEJUT'
 ip_address = '192.168.10.133'
 port = '554'
 stream = 'h264_stream'
-mutex = Lock()
+max_staleness = 2  # how many seconds old a frame can be before the stream is considered lost
 
 
 class IpCameraRunner(Camera):
     """
     An implementation of a Camera runner which sources its camera from a USB camera
     """
-    def __init__(self, model_type: str, model_path: str):
-        super().__init__(model_type, model_path)
+    def __init__(self, model_type: str, model_path: str, predictor=None, machine_ids=None,
+                 capture_size=None, url: str = None):
+        super().__init__(model_type, model_path, predictor, machine_ids, capture_size)
 
         # connect to the stream
-        url = 'rtsp://{}:{}@{}:{}/{}'.format(user, password, ip_address, port, stream)
-        self.camera = cv2.VideoCapture(url)
+        if url is None:
+            url = 'rtsp://{}:{}@{}:{}/{}'.format(user, password, ip_address, port, stream)
+        self.url = url
+        self.camera = cv2.VideoCapture(self.url)
         time.sleep(0.5)
 
-        self.waiting_to_aquire = False
-
-        worker = Thread(target=self.update_stream, args=())
-        worker.setDaemon(True)
-        worker.start()
+        # keep only the latest decoded frame
+        self.grabber = FrameGrabber(self.camera)
+        self.grabber.start()
+        self.frame_sequence = 0
 
-    def update_stream(self):
-        while True:
-            if self.waiting_to_aquire:
-                time.sleep(0.75)
-            mutex.acquire()
-            self.camera.read()
-            mutex.release()
+        # reopen the stream in the background when it is lost
+        self.reconnect_supervisor = ReconnectSupervisor(self.open_stream, self.set_stream, name="ip camera")
 
     def get_frame(self):
         """
-        Retrieves a frames from the camera and returns it
+        Waits for a frame newer than the last one returned and returns it
         """
-        self.waiting_to_aquire = True
-        mutex.acquire()
-        ret, image = self.camera.read()
-        frame_time = time.time()
-        mutex.release()
-        self.waiting_to_aquire = False
+        if not self.reconnect_supervisor.is_connected():
+            return self.no_frame()
 
+        slot = self.frame_pool.next_slot()
         try:
-            image = cv2.resize(image, (self.camera_height, self.camera_width))
+            sequence, image, frame_time, frame_monotonic = self.grabber.wait_for_newer(
+                self.frame_sequence, max_staleness, self.copy_frame, slot)
+            if image is None or sequence <= self.frame_sequence:
+                raise cv2.error("No new frame in {} seconds".format(max_staleness))
+            self.frame_sequence = sequence
+
+            if time.monotonic() - frame_monotonic > max_staleness:
+                raise cv2.error("Latest frame is older than {} seconds".format(max_staleness))
         except cv2.error as e:
-            image = np.zeros([self.camera_height, self.camera_width, 3])
-            logging.info("Error getting frame: " + e)
-            time.sleep(0.5)
-            # connect to the stream
-            url = 'rtsp://{}:{}@{}:{}/{}'.format(user, password, ip_address, port, stream)
-            self.camera = cv2.VideoCapture(url)
+            logging.info("Error getting frame: " + str(e))
+            self.reconnect_supervisor.report_failure(str(e))
+            return self.no_frame()
 
         return image, frame_time
+
+    def open_stream(self):
+        """
+        Opens the stream again, called by the reconnect supervisor
+
+        :return: the opened cv2.VideoCapture, None if it has no frames
+        """
+        # the lost stream stops decoding before it is replaced, the grabber releases it
+        self.grabber.stop()
+
+        camera = cv2.VideoCapture(self.url)
+        if not camera.grab():
+            camera.release()
+            return None
+        return camera
+
+    def set_stream(self, camera):
+        """
+        Starts decoding from a reopened stream, called by the reconnect supervisor
+        """
+        self.camera = camera
+        self.grabber = FrameGrabber(self.camera)
+        self.frame_sequence = 0
+        self.grabber.start()
+
+    def copy_frame(self, frame, slot: int):
+        """
+        Copies the grabber's frame into the frame pool
+        """
+        if self.keep_native_frame:
+            self.native_frame = self.frame_pool.store_native(frame, slot)
+        return self.frame_pool.resize(frame, slot)
@@ -1,7 +1,7 @@
 import time
 
+import numpy as np
 from picamera import PiCamera
-from picamera.array import PiRGBArray
 
 from gymnoscamera.cameras.camera import Camera
 
@@ -10,22 +10,36 @@ class PiCameraRunner(Camera):
     """
     An implementation of a Camera runner which sources its camera from a Pi Camera
     """
-    def __init__(self, model_type: str, model_path: str):
-        super().__init__(model_type, model_path)
+    def __init__(self, model_type: str, model_path: str, predictor=None, machine_ids=None, capture_size=None):
+        super().__init__(model_type, model_path, predictor, machine_ids, capture_size)
 
         # initialize the HOG descriptor/person detector
         self.camera = PiCamera()
-        self.rawCapture = PiRGBArray(self.camera, size=(self.camera_width, self.camera_height))
         self.camera.resolution = (self.camera_width, self.camera_height)
         self.camera.framerate = 32
 
+        # BGR captures are padded to a width that is a multiple of 32 and a height that is a multiple of 16
+        self.padded_width = (self.camera_width + 31) // 32 * 32
+        self.padded_height = (self.camera_height + 15) // 16 * 16
+
         time.sleep(0.1)  # allow the camera to warm up
 
     def get_frame(self):
         """
         Retrieves a frames from the camera and returns it
         """
-        frame = self.camera.capture(self.rawCapture, format="bgr", use_video_port=True)
-        image = frame.array
-
-        return image, time.time()
+        # Capture straight into the frame pool instead of a growing PiRGBArray
+        slot = self.frame_pool.next_slot()
+        if (self.padded_width, self.padded_height) == (self.camera_width, self.camera_height):
+            image = self.frame_pool.capture_buffers[slot]
+            self.camera.capture(image, format="bgr", use_video_port=True)
+            return image, time.time()
+
+        # Unaligned sizes are captured padded, the frame is a view of the capture size
+        padded = self.frame_pool.get_native_buffer(slot)
+        if padded is None:
+            padded = np.empty((self.padded_height, self.padded_width, 3), dtype=np.uint8)
+            self.frame_pool.set_native_buffer(slot, padded)
+        self.camera.capture(padded, format="bgr", use_video_port=True)
+
+        return padded[:self.camera_height, :self.camera_width], time.time()
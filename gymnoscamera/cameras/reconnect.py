@@ -0,0 +1,113 @@
+import logging
+import random
+import threading
+import time
+
+
+class ReconnectSupervisor:
+    """
+    Reopens a lost video source on a background thread with exponential
+    backoff and jitter, so the frame loop never blocks on a slow open.
+
+    The runner reports failures, keeps returning "no frame" while the source
+    is down and receives the reopened source through on_connected. Outage
+    counts and durations are kept for monitoring.
+    """
+
+    def __init__(self, open_source, on_connected, name: str = "camera", base_delay: float = 0.5,
+                 max_delay: float = 30, jitter: float = 0.25):
+        """
+        :param open_source: callable returning a newly opened cv2.VideoCapture
+        :param on_connected: callable taking the reopened source
+        :param name: name of the source used in the logs
+        :param base_delay: seconds to wait after the first failed attempt
+        :param max_delay: most seconds to wait between attempts
+        :param jitter: fraction each delay is randomly stretched or shrunk by
+        """
+        self.open_source = open_source
+        self.on_connected = on_connected
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+        self.lock = threading.Lock()
+        self.connected = True
+        self.worker = None
+
+        # Metrics
+        self.outages = 0
+        self.attempts = 0
+        self.total_outage_time = 0.0
+        self.longest_outage = 0.0
+        self.outage_started = None
+
+    def is_connected(self):
+        return self.connected
+
+    def report_failure(self, reason: str = ""):
+        """
+        Marks the source as down and starts reconnecting if not already
+
+        :param reason: why the source was considered lost
+        """
+        with self.lock:
+            if not self.connected:
+                return
+            self.connected = False
+            self.outages += 1
+            self.outage_started = time.monotonic()
+
+            self.worker = threading.Thread(target=self.reconnect, name="reconnect_" + self.name)
+            self.worker.daemon = True
+            self.worker.start()
+
+        logging.info("Lost {} ({}), reconnecting in the background".format(self.name, reason))
+
+    def get_delay(self, attempt: int):
+        """
+        Returns the seconds to wait after the given failed attempt
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def reconnect(self):
+        attempt = 0
+        while True:
+            self.attempts += 1
+            try:
+                source = self.open_source()
+                if source is not None and source.isOpened():
+                    break
+                if source is not None:
+                    source.release()
+            except Exception as e:
+                logging.info("Reconnecting to {} failed: {}".format(self.name, e))
+
+            time.sleep(self.get_delay(attempt))
+            attempt += 1
+
+        self.on_connected(source)
+
+        with self.lock:
+            outage = time.monotonic() - self.outage_started
+            self.total_outage_time += outage
+            self.longest_outage = max(self.longest_outage, outage)
+            self.outage_started = None
+            self.connected = True
+
+        logging.info("Reconnected to {} after {:.1f} seconds and {} attempts".format(self.name, outage, attempt + 1))
+
+    def get_current_outage(self):
+        """
+        Returns how many seconds the source has been down for, 0 when connected
+        """
+        outage_started = self.outage_started
+        if outage_started is None:
+            return 0.0
+        return time.monotonic() - outage_started
+
+    def log_stats(self):
+        logging.info("{} outages: {}, total {:.1f} seconds, longest {:.1f} seconds, current {:.1f} seconds"
+                     .format(self.name, self.outages, self.total_outage_time, self.longest_outage,
+                             self.get_current_outage()))
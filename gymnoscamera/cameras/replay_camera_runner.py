@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+
+import cv2
+
+from gymnoscamera.cameras.camera import Camera
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DEFAULT_FPS = 30
+
+
+class ReplayFinished(Exception):
+    """
+    Raised by get_frame once every recorded frame has been replayed
+    """
+    pass
+
+
+class ReplayCameraRunner(Camera):
+    """
+    An implementation of a Camera runner which replays a recorded video file
+    or a directory of frames.
+
+    In real time mode frames are released at the pace they were recorded at
+    and stamped with the wall clock. Otherwise frames are returned as fast as
+    they are asked for and stamped with synthetic capture times built from
+    their recorded timestamps, so accounting behaves as it did live.
+
+    Frame files named by their capture time in seconds (e.g. 1565212345.25.jpg)
+    keep that timestamp, any other names are spaced by the given fps.
+    """
+    def __init__(self, model_type: str, model_path: str, predictor=None, machine_ids=None,
+                 capture_size=None, source: str = None, real_time: bool = False, start_time: float = None,
+                 fps: float = None, loop: bool = False):
+        """
+        :param source: path to a video file or a directory of frames
+        :param real_time: release frames at the pace they were recorded at
+        :param start_time: unix time of the first frame, defaults to now
+        :param fps: frame rate to assume when the source has no timestamps
+        :param loop: start again from the first frame when the replay ends
+        """
+        super().__init__(model_type, model_path, predictor, machine_ids, capture_size)
+
+        if not source or not os.path.exists(source):
+            raise ValueError("Replay source '{}' does not exist".format(source))
+
+        self.source = source
+        self.real_time = real_time
+        self.start_time = time.time() if start_time is None else start_time
+        self.fps = fps
+        self.loop = loop
+
+        self.frame_files = None
+        self.frame_file_times = None
+        self.camera = None
+        self.open_source()
+
+        # Replay statistics
+        self.frames_replayed = 0
+        self.replay_offset = 0
+        self.replay_started = None
+        self.last_media_time = 0
+
+    def open_source(self):
+        """
+        Opens the video file or lists the frames in the directory
+        """
+        if os.path.isdir(self.source):
+            self.frame_files = sorted(f for f in os.listdir(self.source) if f.lower().endswith(IMAGE_EXTENSIONS))
+            if not self.frame_files:
+                raise ValueError("No frames found in '{}'".format(self.source))
+            self.frame_file_times = self.get_frame_file_times(self.frame_files)
+            self.frame_index = 0
+        else:
+            self.camera = cv2.VideoCapture(self.source)
+            if not self.camera.isOpened():
+                raise ValueError("Could not open replay source '{}'".format(self.source))
+            if self.fps is None:
+                self.fps = self.camera.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+
+        logging.info("Replaying '{}', real time: {}".format(self.source, self.real_time))
+
+    def get_frame_file_times(self, frame_files):
+        """
+        Returns the recorded time of each frame file in seconds from the first frame
+        """
+        try:
+            times = [float(os.path.splitext(f)[0]) for f in frame_files]
+            return [t - times[0] for t in times]
+        except ValueError:
+            fps = self.fps or DEFAULT_FPS
+            return [i / float(fps) for i in range(len(frame_files))]
+
+    def read_source(self, slot: int):
+        """
+        Reads the next recorded frame, video frames are decoded into the frame pool
+
+        :return: (image, media_time) where media_time is seconds from the first frame,
+                 image is None when the source is exhausted
+        """
+        if self.frame_files is not None:
+            while self.frame_index < len(self.frame_files):
+                frame_file = os.path.join(self.source, self.frame_files[self.frame_index])
+                image = cv2.imread(frame_file)
+                media_time = self.frame_file_times[self.frame_index]
+                self.frame_index += 1
+                if image is not None:
+                    return image, media_time
+                logging.info("Skipping unreadable frame '{}'".format(frame_file))
+            return None, 0
+
+        ret, image = self.camera.read(self.frame_pool.get_native_buffer(slot))
+        if not ret:
+            return None, 0
+        self.frame_pool.set_native_buffer(slot, image)
+
+        media_time = self.camera.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if media_time <= 0 and self.frames_replayed > 0:
+            # Some containers do not report positions
+            media_time = self.frames_replayed / float(self.fps)
+        return image, media_time
+
+    def rewind(self):
+        """
+        Moves back to the first frame, continuing the timeline where it ended
+        """
+        self.replay_offset += self.last_media_time + 1 / float(self.fps or DEFAULT_FPS)
+        if self.frame_files is not None:
+            self.frame_index = 0
+        else:
+            self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def get_frame(self):
+        """
+        Retrieves the next recorded frame and returns it
+        """
+        if self.replay_started is None:
+            self.replay_started = time.time()
+
+        slot = self.frame_pool.next_slot()
+        image, media_time = self.read_source(slot)
+        if image is None and self.loop and self.frames_replayed > 0:
+            self.rewind()
+            image, media_time = self.read_source(slot)
+        if image is None:
+            self.log_stats()
+            raise ReplayFinished(self.source)
+
+        self.last_media_time = media_time
+        media_time += self.replay_offset
+        self.frames_replayed += 1
+
+        if self.real_time:
+            delay = self.replay_started + media_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            frame_time = time.time()
+        else:
+            frame_time = self.start_time + media_time
+
+        self.native_frame = image
+        image = self.frame_pool.resize(image, slot)
+
+        return image, frame_time
+
+    def get_fps(self):
+        """
+        Returns how many frames per second have been replayed
+        """
+        if self.replay_started is None:
+            return 0.0
+        elapsed = time.time() - self.replay_started
+        return self.frames_replayed / elapsed if elapsed > 0 else 0.0
+
+    def log_stats(self):
+        logging.info("Replayed {} frames at {:.2f} FPS".format(self.frames_replayed, self.get_fps()))
@@ -1,9 +1,9 @@
 import cv2
 import time
 import logging
-import numpy as np
 
 from gymnoscamera.cameras.camera import Camera
+from gymnoscamera.cameras.reconnect import ReconnectSupervisor
 
 iou_threshold = 0.01
 time_threshold = 2  # how many seconds until machine is sure you are in or out
@@ -13,25 +13,51 @@ class UsbCameraRunner(Camera):
     """
     An implementation of a Camera runner which sources its camera from a USB camera
     """
-    def __init__(self, model_type: str, model_path: str):
-        super().__init__(model_type, model_path)
+    def __init__(self, model_type: str, model_path: str, predictor=None, machine_ids=None,
+                 capture_size=None, device: int = 0):
+        super().__init__(model_type, model_path, predictor, machine_ids, capture_size)
 
         # initialize the camera
-        self.camera = cv2.VideoCapture(0)
+        self.device = device
+        self.camera = cv2.VideoCapture(self.device)
         time.sleep(0.1)  # allow the camera to warm up
 
+        # reopen the camera in the background when it is lost
+        self.reconnect_supervisor = ReconnectSupervisor(self.open_camera, self.set_camera, name="usb camera")
+
     def get_frame(self):
         """
         Retrieves a frames from the camera and returns it
         """
-        ret, image = self.camera.read()
+        if not self.reconnect_supervisor.is_connected():
+            return self.no_frame()
+
+        slot = self.frame_pool.next_slot()
         try:
-            image = cv2.resize(image, (self.camera_height, self.camera_width))
+            ret, image = self.camera.read(self.frame_pool.get_native_buffer(slot))
+            if not ret:
+                raise cv2.error("The camera returned no frame")
+            self.frame_pool.set_native_buffer(slot, image)
+            self.native_frame = image
+            image = self.frame_pool.resize(image, slot)
         except cv2.error as e:
-            image = np.zeros([self.camera_height, self.camera_width, 3])
-            logging.info("Error getting frame: " + e)
-            time.sleep(0.5)
-            # connect to the stream
-            self.camera = cv2.VideoCapture(0)
+            logging.info("Error getting frame: " + str(e))
+            self.reconnect_supervisor.report_failure(str(e))
+            return self.no_frame()
 
         return image, time.time()
+
+    def open_camera(self):
+        """
+        Opens the camera again, called by the reconnect supervisor
+
+        :return: the opened cv2.VideoCapture
+        """
+        self.camera.release()
+        return cv2.VideoCapture(self.device)
+
+    def set_camera(self, camera):
+        """
+        Reads from a reopened camera, called by the reconnect supervisor
+        """
+        self.camera = camera
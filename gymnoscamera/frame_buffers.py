@@ -0,0 +1,212 @@
+import logging
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# Frames a camera hands out before reusing the buffers of the first, the
+# pipelined loop copies its frames out so only sequential loops hold any
+DEFAULT_BUFFER_COUNT = 4
+
+
+# Value of the letterbox padding once scaled, the grey Darknet pads with
+LETTERBOX_FILL = 128 / 255.
+
+
+class LetterboxInput:
+    """
+    A preallocated float32 network input which frames are letterboxed into.
+
+    Filling it is one fused step: the frame is resized keeping its aspect
+    ratio, then swapped from BGR to RGB, cast and scaled into its place in
+    the tensor. The padding is only written when the frame geometry changes.
+    The network decode maps boxes back to the frame through the same
+    letterbox geometry (see yolo_correct_boxes).
+    """
+
+    def __init__(self, width: int, height: int, batch_size: int = 1):
+        """
+        :param width: network input width
+        :param height: network input height
+        :param batch_size: number of frames the tensor holds
+        """
+        self.width = width
+        self.height = height
+        self.tensor = np.empty((batch_size, height, width, 3), dtype=np.float32)
+
+        self.image_shape = None
+        self.resized = None
+        self.region = None
+
+        # frame shape each position of the batch was last padded for
+        self.padded_shapes = [None] * batch_size
+
+    def configure(self, image_height: int, image_width: int):
+        """
+        Works out where frames of the given size go in the tensor
+        """
+        scale = min(self.width / float(image_width), self.height / float(image_height))
+        new_width = int(round(image_width * scale))
+        new_height = int(round(image_height * scale))
+        dx = (self.width - new_width) // 2
+        dy = (self.height - new_height) // 2
+
+        self.image_shape = (image_height, image_width)
+        self.resized = None
+        if (new_height, new_width) != self.image_shape:
+            self.resized = np.empty((new_height, new_width, 3), dtype=np.uint8)
+        self.region = (slice(dy, dy + new_height), slice(dx, dx + new_width))
+
+    def fill(self, image, index: int = 0):
+        """
+        Letterboxes a BGR uint8 frame into the tensor
+
+        :param image: frame of shape (height, width, 3)
+        :param index: position of the frame in the batch
+        :return: the tensor
+        """
+        if image.shape[:2] != self.image_shape:
+            self.configure(*image.shape[:2])
+        if self.padded_shapes[index] != self.image_shape:
+            self.tensor[index].fill(LETTERBOX_FILL)
+            self.padded_shapes[index] = self.image_shape
+
+        if self.resized is not None:
+            image = cv2.resize(image, (self.resized.shape[1], self.resized.shape[0]), dst=self.resized)
+
+        # Casting first and scaling in place avoids the ufunc cast buffers
+        region = self.tensor[index][self.region]
+        np.copyto(region, image[..., ::-1], casting='unsafe')
+        np.multiply(region, np.float32(1 / 255.), out=region)
+
+        return self.tensor
+
+
+def letterbox_batch(images, width: int, height: int):
+    """
+    Letterboxes frames into one network input batch, the frames can differ in size
+
+    :return: float32 tensor of shape (len(images), height, width, 3)
+    """
+    network_input = LetterboxInput(width, height, len(images))
+    for i, image in enumerate(images):
+        network_input.fill(image, i)
+
+    return network_input.tensor
+
+
+class FrameBufferPool:
+    """
+    Reusable buffers for the frame path of a camera.
+
+    Buffers are handed out round robin from a ring, a slot holds a uint8
+    buffer at the capture size and one at whatever size the camera natively
+    produces. A slot is reused count frames later whether or not its frame
+    is still in use, so a frame held for longer than that has to be copied
+    out (see Camera.capture_frame). One letterboxed network input is kept
+    for the inference stage.
+    """
+
+    def __init__(self, width: int, height: int, input_size: tuple = None, count: int = DEFAULT_BUFFER_COUNT):
+        """
+        :param width: width of the frames handed to the predictor
+        :param height: height of the frames handed to the predictor
+        :param input_size: (width, height) of the network input, defaults to the frame size
+        :param count: number of slots in the ring
+        """
+        self.width = width
+        self.height = height
+
+        self.capture_buffers = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(count)]
+        self.native_buffers = [None] * count
+        input_width, input_height = input_size or (width, height)
+        self.network_input = LetterboxInput(input_width, input_height)
+        self.slot = 0
+
+    def next_slot(self):
+        """
+        Moves to the next slot in the ring and returns it
+        """
+        self.slot = (self.slot + 1) % len(self.capture_buffers)
+        return self.slot
+
+    def get_native_buffer(self, slot: int):
+        """
+        Returns the native size buffer of a slot, None until one has been stored
+        """
+        return self.native_buffers[slot]
+
+    def set_native_buffer(self, slot: int, image):
+        """
+        Keeps a natively sized frame so it can be read into again
+        """
+        self.native_buffers[slot] = image
+
+    def store_native(self, image, slot: int):
+        """
+        Copies a natively sized frame into the native buffer of a slot
+
+        :return: the native buffer
+        """
+        native = self.native_buffers[slot]
+        if native is None or native.shape != image.shape or native.dtype != image.dtype:
+            native = self.native_buffers[slot] = image.copy()
+        else:
+            np.copyto(native, image)
+        return native
+
+    def resize(self, image, slot: int):
+        """
+        Resizes a frame into the capture buffer of a slot
+
+        :return: the capture buffer
+        """
+        return cv2.resize(image, (self.width, self.height), dst=self.capture_buffers[slot])
+
+    def blank(self, slot: int):
+        """
+        Clears the capture buffer of a slot and returns it
+        """
+        buffer = self.capture_buffers[slot]
+        buffer.fill(0)
+        return buffer
+
+    def get_input_tensor(self, image):
+        """
+        Letterboxes a frame into the network input
+
+        :param image: frame with the capture size
+        :return: float32 tensor of shape (1, input height, input width, 3)
+        """
+        return self.network_input.fill(image)
+
+
+def measure_allocations(step, frames: int = 100, warmup: int = 10):
+    """
+    Measures the heap memory a frame step allocates once warmed up
+
+    :param step: callable running the frame path once
+    :param frames: number of measured frames
+    :param warmup: number of frames to run before measuring
+    :return: (most bytes allocated at once, bytes retained per frame)
+    """
+    for _ in range(warmup):
+        step()
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(frames):
+            step()
+            current, frame_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame_peak - start)
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    retained = (end - start) / float(frames)
+    logging.info("Frame path allocates at most {} bytes at once, retaining {:.1f} bytes per frame"
+                 .format(peak, retained))
+
+    return peak, retained
@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# A slot for the writer, one for the latest frame and one for the reader
+SLOT_COUNT = 3
+
+# Header layout: latest slot, reading slot, sequence of the latest frame
+LATEST = 0
+READING = 1
+SEQUENCE = 2
+HEADER_LENGTH = 3
+
+
+class SharedFrameRing:
+    """
+    A triple buffer of frames in shared memory, written by one process and
+    read zero-copy by another.
+
+    The writer only ever writes into the slot that is neither the latest
+    frame nor the one being read, so a frame handed to the reader stays
+    intact until the reader asks for the next one. Sequence numbers and
+    capture times live in a small header next to the frames.
+    """
+
+    def __init__(self, shape: tuple, name: str = None, lock=None):
+        """
+        :param shape: shape of a uint8 frame
+        :param name: name of an existing ring to attach to, None creates a new ring
+        :param lock: the multiprocessing.Lock shared by both sides of the ring
+        """
+        if shared_memory is None:
+            raise RuntimeError("The shared memory frame bus requires Python 3.8 or newer")
+
+        self.shape = tuple(shape)
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.owner = name is None
+
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = 8 * (HEADER_LENGTH + 2 * SLOT_COUNT)
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=header_bytes + SLOT_COUNT * frame_bytes)
+        self.name = self.shm.name
+
+        buffer = self.shm.buf
+        self.header = np.ndarray((HEADER_LENGTH,), dtype=np.int64, buffer=buffer)
+        self.slot_sequences = np.ndarray((SLOT_COUNT,), dtype=np.int64, buffer=buffer,
+                                         offset=8 * HEADER_LENGTH)
+        self.slot_times = np.ndarray((SLOT_COUNT,), dtype=np.float64, buffer=buffer,
+                                     offset=8 * (HEADER_LENGTH + SLOT_COUNT))
+        self.frames = np.ndarray((SLOT_COUNT,) + self.shape, dtype=np.uint8, buffer=buffer,
+                                 offset=header_bytes)
+
+        if self.owner:
+            self.header[:] = (-1, -1, 0)
+
+    def get_write_slot(self):
+        """
+        Returns the slot the writer can fill with the next frame
+        """
+        with self.lock:
+            busy = (self.header[LATEST], self.header[READING])
+            for slot in range(SLOT_COUNT):
+                if slot not in busy:
+                    return slot
+
+    def publish(self, slot: int, frame_time: float):
+        """
+        Marks a filled slot as the latest frame
+
+        :param slot: slot the frame was written into
+        :param frame_time: the exact time the frame was captured on
+        :return: sequence number of the frame
+        """
+        with self.lock:
+            sequence = int(self.header[SEQUENCE]) + 1
+            self.header[SEQUENCE] = sequence
+            self.slot_sequences[slot] = sequence
+            self.slot_times[slot] = frame_time
+            self.header[LATEST] = slot
+
+        return sequence
+
+    def write(self, image, frame_time: float):
+        """
+        Copies a frame into the ring and publishes it
+
+        :return: sequence number of the frame
+        """
+        slot = self.get_write_slot()
+        np.copyto(self.frames[slot], image)
+        return self.publish(slot, frame_time)
+
+    def acquire_latest(self):
+        """
+        Hands the latest frame to the reader, it stays valid until the next call
+
+        :return: (sequence, image, frame_time), image is None before the first frame
+        """
+        with self.lock:
+            slot = int(self.header[LATEST])
+            if slot < 0:
+                return 0, None, 0.0
+            self.header[READING] = slot
+            return int(self.slot_sequences[slot]), self.frames[slot], float(self.slot_times[slot])
+
+    def close(self):
+        """
+        Detaches from the ring, the creating side also frees it
+        """
+        # Views have to be released before the shared memory can be closed
+        self.header = self.slot_sequences = self.slot_times = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def run_capture_process(camera_type: str, camera_args: dict, ring_name: str, shape: tuple, lock, connection):
+    """
+    Entry point of the capture process. Frames from the camera are written
+    into the ring and their sequence number and capture time are sent down
+    the connection. None is sent while the camera has no frames. If the
+    camera raises, ReplayFinished at the end of a replay among others, the
+    exception is sent and the process stops.
+
+    :param camera_type: type of camera to capture from
+    :param camera_args: extra arguments for the camera runner
+    :param ring_name: name of the shared frame ring
+    :param shape: shape of a frame
+    :param lock: lock shared with the ring
+    :param connection: end of a multiprocessing.Pipe to send frame metadata on
+    """
+    from gymnoscamera.cameras import camera_factory
+    from gymnoscamera.cameras.camera import NO_FRAME_DELAY
+
+    ring = SharedFrameRing(shape, ring_name, lock)
+
+    try:
+        # Without a model type the camera only captures
+        camera = camera_factory.factory.get_camera(camera_type, None, None, **camera_args)
+        logging.info("Capture process started for '{}' camera".format(camera_type))
+
+        while True:
+            image, frame_time = camera.get_frame()
+            if image is None:
+                connection.send(None)
+                time.sleep(NO_FRAME_DELAY)
+                continue
+            sequence = ring.write(image, frame_time)
+            connection.send((sequence, frame_time))
+    except (BrokenPipeError, EOFError):
+        logging.info("Capture process stopping, the reader went away")
+    except Exception as e:
+        # The reader raises it again
+        logging.info("Capture process stopping: {!r}".format(e))
+        try:
+            send_exception(connection, e)
+        except (BrokenPipeError, EOFError):
+            pass
+    finally:
+        ring.close()
+
+
+def send_exception(connection, exception: Exception):
+    """
+    Sends an exception to the reader, as a RuntimeError with its text if it can not be pickled
+    """
+    try:
+        connection.send(exception)
+    except (BrokenPipeError, EOFError):
+        raise
+    except Exception:
+        # Pickling failed before anything was sent
+        connection.send(RuntimeError("{}: {}".format(type(exception).__name__, exception)))
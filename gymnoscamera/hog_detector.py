@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+from gymnoscamera.yolo_network.postprocess import non_max_suppression
+
+# Size of the window the default people detector was trained on
+HOG_WINDOW = (64, 128)  # width, height
+
+
+class HogDetector:
+    """
+    OpenCV's HOG and linear SVM people detector.
+
+    Frames of any size go in as they are, so ROI crops are searched at their
+    own resolution. Frames too small to hold the detection window are scaled
+    up first. Overlapping windows are merged with NMS.
+    """
+
+    _defaults = {
+        "win_stride": (8, 8),
+        "padding": (8, 8),
+        "scale": 1.05,
+        "score": 0.5,  # SVM margin a window needs to count as a person
+        "iou": 0.45,
+        "min_height": 160,  # frames shorter than this are scaled up before the search
+    }
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(self._defaults)  # set up default values
+        self.__dict__.update(kwargs)  # and update with user overrides
+
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def get_input_size(self):
+        """
+        Returns None, the detector takes frames of any size
+        """
+        return None
+
+    def detect_image(self, image, network_input=None):
+        """
+        Finds the people in a frame
+
+        :param image: BGR uint8 frame of any size
+        :param network_input: unused, frames are searched at their own size
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        (image_height, image_width, channels) = image.shape
+
+        factor = max(1.0, self.min_height / float(image_height), HOG_WINDOW[0] / float(image_width))
+        if factor > 1.0:
+            image = cv2.resize(image, (int(round(image_width * factor)), int(round(image_height * factor))))
+
+        (rects, weights) = self.hog.detectMultiScale(image, winStride=self.win_stride, padding=self.padding,
+                                                     scale=self.scale)
+        rects = np.asarray(rects, dtype=np.float32).reshape(-1, 4) / factor
+        weights = np.asarray(weights, dtype=np.float32).reshape(-1)
+
+        keep = weights > self.score
+        rects, weights = rects[keep], weights[keep]
+
+        # (top, left, bottom, right) for NMS
+        boxes = np.stack([rects[:, 1], rects[:, 0], rects[:, 1] + rects[:, 3], rects[:, 0] + rects[:, 2]], axis=1)
+        boxes = boxes[non_max_suppression(boxes, weights, self.iou, max_boxes=len(boxes))]
+
+        coords = np.empty((len(boxes), 4), dtype=np.int32)
+        coords[:, 0] = np.clip(np.floor(boxes[:, 1] + 0.5), 0, image_width)
+        coords[:, 1] = np.clip(np.floor(boxes[:, 0] + 0.5), 0, image_height)
+        coords[:, 2] = np.clip(np.floor(boxes[:, 3] + 0.5), 0, image_width)
+        coords[:, 3] = np.clip(np.floor(boxes[:, 2] + 0.5), 0, image_height)
+
+        return coords
@@ -1,11 +1,14 @@
-import datetime
-import threading
 import logging
 
 import cv2
+import numpy as np
 import gymnos_firestore.machines as machines
-from gymnos_firestore import usage
-from matchbox.queries.error import DocumentDoesNotExists
+
+from gymnoscamera import occupancy as occupancy_policies, status_publisher, usage_writer
+
+OCCUPANCY_POLICY_KEY = 'policy'
+OCCUPANCY_THRESHOLD_KEY = 'threshold'
+OCCUPANCY_POLYGON_KEY = 'polygon'
 
 
 class Machine:
@@ -13,7 +16,15 @@ class Machine:
     This class keeps track of machine coordinates and machine usage
     """
 
-    def __init__(self, station: machines.Machines, camera_width, camera_height):
+    def __init__(self, station: machines.Machines, camera_width, camera_height, occupancy: dict = None):
+        """
+        :param station: the machine model
+        :param camera_width: width of the frames the machine is drawn on
+        :param camera_height: height of the frames the machine is drawn on
+        :param occupancy: how a person counts as using the machine, a dict with a "policy" from
+                          gymnoscamera.occupancy.POLICIES, an optional "threshold" and for the
+                          foot point policy an optional "polygon" of [x, y] ratios
+        """
         (top_x, left_y, bottom_x, right_y) = self.convert_station_ratios(station, camera_width, camera_height)
         self.model = station
 
@@ -43,6 +54,19 @@ class Machine:
         """
         self.padding = 10
 
+        # How a person counts as being inside, strict padded containment by default
+        occupancy = occupancy or {}
+        self.occupancy_policy = occupancy_policies.get_policy(
+            occupancy.get(OCCUPANCY_POLICY_KEY, occupancy_policies.CONTAINMENT))
+        self.occupancy_threshold = occupancy.get(OCCUPANCY_THRESHOLD_KEY,
+                                                 occupancy_policies.DEFAULT_THRESHOLDS[self.occupancy_policy])
+        if self.occupancy_policy == occupancy_policies.IOU:
+            self.iou_threshold = self.occupancy_threshold
+        self.polygon = None
+        if occupancy.get(OCCUPANCY_POLYGON_KEY):
+            self.polygon = [(int(x * camera_width), int(y * camera_height))
+                            for (x, y) in occupancy[OCCUPANCY_POLYGON_KEY]]
+
     def get_machine_colour(self):
         if self.model.name == "squat_rack":
             return 0, 0, 255
@@ -113,10 +137,19 @@ class Machine:
         for person in people:
             (h_top_x, h_left_y, h_bottom_x, h_right_y) = person
 
-            person_inside = self.check_inside((h_top_x, h_left_y, h_bottom_x, h_right_y))
+            person_inside = self.check_occupied((h_top_x, h_left_y, h_bottom_x, h_right_y))
             if person_inside:
                 break
 
+        self.update_usage(person_inside, image_cap_time)
+
+    def update_usage(self, person_inside, image_cap_time):
+        """
+        Updates the machine usage with whether somebody is inside the machine
+
+        :param person_inside: True if at least one person is inside the machine
+        :param image_cap_time: The exact time the image was captured on
+        """
         # if there is somebody in the machine
         if person_inside:
             self.last_seen_unix = image_cap_time
@@ -129,9 +162,7 @@ class Machine:
                 # of time, we can be sure the machine is in use
                 if diff > self.time_threshold:
                     # Tell all clients this machine is being used now
-                    if self.model.open:
-                        self.model.open = False
-                        self.model.save()
+                    self.set_open(False)
 
                     self.using = True
                     self.time_elapsed = self.first_detected
@@ -151,38 +182,41 @@ class Machine:
                     logging.info("Used for: " + str(image_cap_time - self.first_detected))
 
                     # Send to database
-                    start_time, end_time = self.first_detected, image_cap_time
-                    db_thread = threading.Thread(target=self.insert_machine_time, args=[start_time, end_time])
-                    db_thread.start()
+                    self.insert_machine_time(self.first_detected, image_cap_time)
+
+                    # Tell all clients this machine is free again
+                    self.set_open(True)
+
+    def pause(self, duration):
+        """
+        Freezes the usage timers over a period no frames were seen in,
+        so the gap is counted neither as usage nor as absence
+
+        :param duration: seconds without frames
+        """
+        if self.inside:
+            self.first_detected += duration
+            self.last_seen_unix += duration
+        if self.using:
+            self.time_elapsed += duration
 
     def insert_machine_time(self, start: int, end: int):
         """
-        Inserts a row of machine usage
+        Queues a row of machine usage for the usage writer
 
         :param start: Start of machine usage in Unix time
         :param end: End of machine usage in Unix time
         """
-        today = datetime.date.today().strftime("%Y/%m/%d")
-        machine_time = '{}#{}'.format(start, end)
-        time_used = end - start
-
-        try:
-            usage_today = usage.Usage.objects.get(machine_id=self.model.id, date=today)
-        except DocumentDoesNotExists:
-            usage_today = usage.Usage()
-            usage_today.date = today
-            usage_today.machine_id = self.model.id
-            usage_today.name = self.model.name
-            usage_today.times = []
-            usage_today.total_time = 0
+        usage_writer.writer.submit(self, start, end)
 
-        usage_today.times.append(machine_time)
-        usage_today.total_time += time_used
-        usage_today.save()
+    def set_open(self, is_open: bool):
+        """
+        Tells all clients whether this machine is free, without waiting
+        for the database
 
-        if not self.model.open:
-            self.model.open = True
-            self.model.save()
+        :param is_open: True if nobody is using the machine
+        """
+        status_publisher.publisher.publish(self.model, is_open)
 
     def calculate_iou(self, box_a, box_b):
         """
@@ -226,4 +260,18 @@ class Machine:
         return p_top_x >= self.top_x and p_left_y >= self.left_y and p_bottom_x <= self.bottom_x \
             and p_right_y <= self.right_y
 
+    def check_occupied(self, person):
+        """
+        Checks to see if a person is inside the machine by its occupancy policy
+        """
+        if self.occupancy_policy == occupancy_policies.CONTAINMENT:
+            return self.check_inside(person)
+        if self.occupancy_policy == occupancy_policies.IOU:
+            return self.calculate_iou(person, (self.top_x, self.left_y, self.bottom_x, self.right_y)) \
+                >= self.iou_threshold
+
+        check = occupancy_policies.OCCUPANCY_CHECKS[self.occupancy_policy]
+        return bool(check(np.array(person), np.array((self.top_x, self.left_y, self.bottom_x, self.right_y)),
+                          self.padding, self.occupancy_threshold, occupancy_policies.get_polygons([self])[0]))
+
     # Add function to calculate overlapping machines
@@ -0,0 +1,143 @@
+import logging
+
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides whether a frame needs to go through the predictor by differencing
+    the station regions against the frame the predictor last ran on.
+
+    The predictor is skipped when no station region changed, unless a station
+    is waiting on a decision (someone is inside it but not yet using it) or
+    the last prediction is older than the refresh period. Skipped frames
+    reuse the last detections, so a person using a station stays in it until
+    motion in its region shows them leaving.
+    """
+
+    def __init__(self, stations: list, pixel_threshold: int = 25, changed_fraction: float = 0.02,
+                 refresh_period: float = 5, stride: int = 2):
+        """
+        :param stations: the Machine objects to watch
+        :param pixel_threshold: how much a pixel has to change to count as changed
+        :param changed_fraction: fraction of changed pixels that marks a station as changed
+        :param refresh_period: seconds after which the predictor is always run
+        :param stride: only every stride'th pixel of a region is compared
+        """
+        self.stations = stations
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.refresh_period = refresh_period
+        self.stride = stride
+
+        self.references = None
+        self.last_prediction_time = 0
+        self.last_coords = np.zeros((0, 4), dtype=np.int32)
+
+        # Counters
+        self.frames = 0
+        self.skipped = 0
+        self.motion_triggered = 0
+        self.state_triggered = 0
+        self.refresh_triggered = 0
+
+    def get_regions(self, image):
+        """
+        Returns the padded region of each station, sampled every stride pixels
+
+        :param image: frame to take the regions from
+        :return: [region]
+        """
+        height, width = image.shape[:2]
+        stride = self.stride
+        regions = []
+        for station in self.stations:
+            top = max(0, min(station.left_y, station.right_y) - station.padding)
+            bottom = min(height, max(station.left_y, station.right_y) + station.padding)
+            left = max(0, min(station.top_x, station.bottom_x) - station.padding)
+            right = min(width, max(station.top_x, station.bottom_x) + station.padding)
+            regions.append(np.array(image[top:bottom:stride, left:right:stride], dtype=np.int16))
+
+        return regions
+
+    def has_motion(self, regions):
+        """
+        Checks if any station region changed since the last prediction
+        """
+        for region, reference in zip(regions, self.references):
+            if region.size == 0 or region.shape != reference.shape:
+                continue
+            changed = np.abs(region - reference).max(axis=-1) > self.pixel_threshold
+            if changed.mean() > self.changed_fraction:
+                return True
+
+        return False
+
+    def needs_refresh(self):
+        """
+        Checks if any station is waiting out its time threshold to confirm someone is using it
+        """
+        for station in self.stations:
+            if station.inside and not station.using:
+                return True
+
+        return False
+
+    def should_predict(self, image, frame_cap_time):
+        """
+        Decides whether the predictor has to run on this frame
+
+        :param image: frame to check
+        :param frame_cap_time: The exact time the frame was captured on
+        :return: True if the predictor should run, False to reuse last_coords
+        """
+        self.frames += 1
+        regions = self.get_regions(image)
+
+        if self.references is None:
+            reason = None
+        elif frame_cap_time - self.last_prediction_time > self.refresh_period:
+            self.refresh_triggered += 1
+            reason = 'refresh'
+        elif self.needs_refresh():
+            self.state_triggered += 1
+            reason = 'state'
+        elif self.has_motion(regions):
+            self.motion_triggered += 1
+            reason = 'motion'
+        else:
+            self.skipped += 1
+            return False
+
+        logging.debug("Motion gate running predictor, reason: " + str(reason))
+        self.references = regions
+        self.last_prediction_time = frame_cap_time
+        return True
+
+    def record_skip(self):
+        """
+        Counts a frame the predictor was skipped on before the gate was asked
+        """
+        self.frames += 1
+        self.skipped += 1
+
+    def update(self, people_coords):
+        """
+        Stores the detections of the frame the predictor just ran on
+
+        :param people_coords: coordinates of each person
+        """
+        self.last_coords = people_coords
+
+    def get_skip_rate(self):
+        """
+        Returns the fraction of frames the predictor was skipped on
+        """
+        if self.frames == 0:
+            return 0.0
+        return self.skipped / self.frames
+
+    def log_stats(self):
+        logging.info("Motion gate skipped {} of {} frames ({:.1%}), ran on motion: {}, state: {}, refresh: {}"
+                     .format(self.skipped, self.frames, self.get_skip_rate(), self.motion_triggered,
+                             self.state_triggered, self.refresh_triggered))
@@ -0,0 +1,114 @@
+import numpy as np
+
+# How a person counts as being in a station
+CONTAINMENT = 'containment'  # the person's box lies inside the padded station
+IOU = 'iou'  # the person's box and the station overlap by at least the threshold IoU
+FOOT_POINT = 'foot_point'  # the bottom middle of the person's box lies inside the station's polygon
+OVERLAP = 'overlap'  # at least the threshold fraction of the person's box lies inside the station
+
+POLICIES = (CONTAINMENT, IOU, FOOT_POINT, OVERLAP)
+DEFAULT_THRESHOLDS = {CONTAINMENT: 0.0, IOU: 0.01, FOOT_POINT: 0.0, OVERLAP: 0.5}
+
+# Every check takes arrays which broadcast against each other, either a
+# (people, 1) side against a (stations,) side or one entry per pair:
+#   people: (..., 4) person boxes
+#   boxes: (..., 4) station rectangles
+#   padding: station padding
+#   thresholds: station thresholds
+#   polygons: (..., vertices, 2) station polygons, padded by repeating the last vertex
+
+
+def check_containment(people, boxes, padding, thresholds, polygons):
+    return (people[..., 0] + padding >= boxes[..., 0]) & (people[..., 1] + padding >= boxes[..., 1]) \
+        & (people[..., 2] - padding <= boxes[..., 2]) & (people[..., 3] - padding <= boxes[..., 3])
+
+
+def get_intersections(people, boxes):
+    """
+    Returns the intersection areas, counting pixels inclusively like Machine.calculate_iou
+    """
+    width = np.minimum(people[..., 2], boxes[..., 2]) - np.maximum(people[..., 0], boxes[..., 0]) + 1
+    height = np.minimum(people[..., 3], boxes[..., 3]) - np.maximum(people[..., 1], boxes[..., 1]) + 1
+    return np.clip(width, 0, None).astype(np.float64) * np.clip(height, 0, None)
+
+
+def get_areas(boxes):
+    return (boxes[..., 2] - boxes[..., 0] + 1).astype(np.float64) * (boxes[..., 3] - boxes[..., 1] + 1)
+
+
+def check_iou(people, boxes, padding, thresholds, polygons):
+    intersections = get_intersections(people, boxes)
+    unions = get_areas(people) + get_areas(boxes) - intersections
+    return intersections >= thresholds * np.maximum(unions, 1)
+
+
+def check_overlap(people, boxes, padding, thresholds, polygons):
+    return get_intersections(people, boxes) >= thresholds * np.maximum(get_areas(people), 1)
+
+
+def check_foot_point(people, boxes, padding, thresholds, polygons):
+    """
+    Crossing number test of each person's foot point against the polygons
+    """
+    x = ((people[..., 0] + people[..., 2]) / 2.0)[..., np.newaxis]
+    y = people[..., 3][..., np.newaxis].astype(np.float64)
+
+    x1 = polygons[..., 0]
+    y1 = polygons[..., 1]
+    x2 = np.roll(x1, -1, axis=-1)
+    y2 = np.roll(y1, -1, axis=-1)
+
+    # Edges the horizontal ray to the right of the point crosses
+    straddles = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    crossings = straddles & (x < crossing_x)
+
+    return crossings.sum(axis=-1) % 2 == 1
+
+
+OCCUPANCY_CHECKS = {
+    CONTAINMENT: check_containment,
+    IOU: check_iou,
+    FOOT_POINT: check_foot_point,
+    OVERLAP: check_overlap,
+}
+
+
+def get_policy(policy: str):
+    """
+    Checks a policy name
+
+    :return: the policy
+    """
+    if policy not in OCCUPANCY_CHECKS:
+        raise ValueError("Unknown occupancy policy '{}', use one of {}".format(policy, list(POLICIES)))
+    return policy
+
+
+def get_polygons(stations):
+    """
+    Returns the polygon of each station as one array, stations without one
+    get their padded rectangle
+
+    :param stations: Machine objects
+    :return: (stations, vertices, 2) array
+    """
+    polygons = []
+    for station in stations:
+        polygon = station.polygon
+        if polygon is None:
+            x1 = min(station.top_x, station.bottom_x) - station.padding
+            y1 = min(station.left_y, station.right_y) - station.padding
+            x2 = max(station.top_x, station.bottom_x) + station.padding
+            y2 = max(station.left_y, station.right_y) + station.padding
+            polygon = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        polygons.append(polygon)
+
+    vertices = max([len(polygon) for polygon in polygons] or [0])
+    padded = np.zeros((len(polygons), vertices, 2), dtype=np.float64)
+    for i, polygon in enumerate(polygons):
+        padded[i, :len(polygon)] = polygon
+        padded[i, len(polygon):] = polygon[-1]
+
+    return padded
@@ -0,0 +1,258 @@
+import collections
+import logging
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class DropOldestQueue:
+    """
+    A bounded queue which discards its oldest item when it is full, so the
+    consumer always receives the freshest item that was produced
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self.items = collections.deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """
+        Adds an item to the queue, dropping the oldest one if the queue is full
+
+        :param item: item to add
+        """
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout: float = None):
+        """
+        Removes and returns the oldest item in the queue
+
+        :param timeout: seconds to wait for an item, None waits forever
+        :return: item
+        :raises queue.Empty: if no item arrived before the timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.items) > 0, timeout):
+                raise queue.Empty
+            return self.items.popleft()
+
+
+class FramePipeline:
+    """
+    Runs frame capture and inference as separate stages on their own threads.
+
+    The stages are joined by drop-oldest queues so a slow stage never makes a
+    faster one wait. Results are consumed by the caller (the accounting stage)
+    through get_result, each one carrying the frame's real capture time.
+
+    Several frames are in flight at once, so the frames get_frame returns have
+    to stay valid until the result is consumed, they can not be buffers the
+    camera reuses.
+    """
+
+    def __init__(self, get_frame, predict, queue_size: int = 1, no_frame_delay: float = 0.05):
+        """
+        :param get_frame: callable returning (image, frame_cap_time, ...), image is None when there is no frame
+        :param predict: callable taking what get_frame returned and returning people coordinates
+        :param queue_size: capacity of each queue between stages
+        :param no_frame_delay: seconds to wait before capturing again when there was no frame
+        """
+        self.get_frame = get_frame
+        self.predict = predict
+        self.no_frame_delay = no_frame_delay
+
+        self.capture_queue = DropOldestQueue(queue_size)
+        self.result_queue = DropOldestQueue(queue_size)
+
+        self.running = False
+        self.workers = []
+        self.error = None
+
+    def start(self):
+        """
+        Starts the capture and inference stages
+        """
+        self.running = True
+        self.workers = [threading.Thread(target=self.capture_stage, name="capture_stage"),
+                        threading.Thread(target=self.inference_stage, name="inference_stage")]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def stop(self, timeout: float = 1.0):
+        """
+        Signals the stages to stop and waits for them to finish
+
+        :param timeout: seconds to wait for each stage
+        """
+        self.running = False
+        for worker in self.workers:
+            worker.join(timeout)
+        logging.info("Pipeline stopped, dropped frames: {} captured, {} inferred"
+                     .format(self.capture_queue.dropped, self.result_queue.dropped))
+
+    def capture_stage(self):
+        while self.running:
+            try:
+                frame = self.get_frame()
+            except Exception as e:
+                # Hand the error to the consumer and shut the pipeline down
+                self.error = e
+                self.running = False
+                break
+            if frame[0] is None:
+                # The camera is down, it will not have a frame right away
+                time.sleep(self.no_frame_delay)
+                continue
+            self.capture_queue.put(frame)
+
+    def inference_stage(self):
+        while self.running:
+            try:
+                frame = self.capture_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                people_coords = self.predict(*frame)
+            except Exception as e:
+                # Hand the error to the consumer and shut the pipeline down
+                self.error = e
+                self.running = False
+                break
+            self.result_queue.put(frame + (people_coords,))
+
+    def get_result(self, timeout: float = None):
+        """
+        Retrieves the freshest inference result
+
+        :param timeout: seconds to wait for a result, None waits forever
+        :return: what get_frame returned followed by the people coordinates
+        :raises queue.Empty: if no result arrived before the timeout
+        :raises Exception: the error that stopped a stage
+        """
+        try:
+            return self.result_queue.get(timeout)
+        except queue.Empty:
+            if self.error is not None:
+                raise self.error
+            raise
+
+
+class MicroBatcher:
+    """
+    Collects frames submitted from any thread into batches for a batched
+    predictor.
+
+    A batch is run as soon as it is full, or once the deadline after its
+    first frame has passed, so a lone frame never waits longer than the
+    deadline for company.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 4, deadline: float = 0.02):
+        """
+        :param run_batch: callable taking a list of frames and returning a list of results,
+                          such as Predictors.run_prediction_batch
+        :param max_batch_size: most frames in a batch
+        :param deadline: most seconds a frame waits for the batch to fill
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.deadline = deadline
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.worker = None
+
+        self.batches = 0
+        self.frames = 0
+
+    def start(self):
+        """
+        Starts the batching thread
+        """
+        self.running = True
+        self.worker = threading.Thread(target=self.batch_stage, name="micro_batcher")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self, timeout: float = 1.0):
+        """
+        Stops the batching thread once the pending frames have been run
+
+        :param timeout: seconds to wait for the thread to finish
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.worker is not None:
+            self.worker.join(timeout)
+        logging.info("Micro batcher stopped, {} frames in {} batches".format(self.frames, self.batches))
+
+    def submit(self, frame):
+        """
+        Adds a frame to the next batch
+
+        :param frame: frame to run
+        :return: Future of the frame's result
+        """
+        future = Future()
+        with self.condition:
+            self.pending.append((frame, future))
+            self.condition.notify()
+        return future
+
+    def predict(self, frame, timeout: float = None):
+        """
+        Runs a frame as part of a batch and waits for its result
+
+        :param frame: frame to run
+        :param timeout: seconds to wait for the result, None waits forever
+        :return: the frame's result
+        """
+        return self.submit(frame).result(timeout)
+
+    def next_batch(self):
+        """
+        Waits for a full batch or the deadline of the first pending frame
+
+        :return: list of (frame, future), empty once stopped
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or not self.running)
+            deadline = time.monotonic() + self.deadline
+            while self.running and len(self.pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[:self.max_batch_size]
+            del self.pending[:self.max_batch_size]
+            return batch
+
+    def batch_stage(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                break
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.run_batch([frame for frame, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(batch)
+            for future, result in zip(futures, results):
+                future.set_result(result)
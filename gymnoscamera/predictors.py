@@ -1,8 +1,75 @@
 # Continuously capture frames and perform object detection on them
-import cv2
-import numpy as np
+import collections
+import importlib
 import logging
-from timeit import default_timer as timer
+import threading
+
+import numpy as np
+
+# What a detector backend can do, so the runtime can pick batching, threading
+# and preprocessing for it
+#   batching: detect_images runs a whole batch at once
+#   input_size: preferred (width, height) of the input, None for any size
+#   input_dtype: 'float32' for a letterboxed RGB tensor, 'uint8' for the BGR frame as it is
+#   resizable_input: a loaded model runs at the size of whichever network_input it is given
+#   thread_safe: the model can be called from several threads at once
+#   needs_warm_up: the first call is much slower than the rest
+DetectorCapabilities = collections.namedtuple(
+    'DetectorCapabilities', ['batching', 'input_size', 'input_dtype', 'resizable_input', 'thread_safe',
+                             'needs_warm_up'])
+
+DetectorBackend = collections.namedtuple('DetectorBackend', ['description', 'module', 'class_name', 'capabilities'])
+
+detectors = collections.OrderedDict()
+
+
+def register_detector(model_type: str, description: str, module: str, class_name: str,
+                      capabilities: DetectorCapabilities):
+    """
+    Registers a detector backend. The module is only imported when the
+    backend is used, so backends do not pull in each other's dependencies.
+
+    A backend class takes its settings as keyword arguments (model_path and
+    model_image_size among them), and has get_input_size() and
+    detect_image(image, network_input=None) returning an (N, 4) int32 array of
+    (left, top, right, bottom) people coordinates. Batching backends also
+    have detect_images(images, letterbox=True).
+
+    :param model_type: name the backend is chosen by
+    :param description: what is logged when the backend is loaded
+    :param module: module the backend class is in
+    :param class_name: name of the backend class
+    :param capabilities: DetectorCapabilities of the backend
+    """
+    detectors[model_type] = DetectorBackend(description, module, class_name, capabilities)
+
+
+def get_capabilities(model_type: str):
+    """
+    Returns the DetectorCapabilities of a registered backend without loading it
+    """
+    if model_type not in detectors:
+        raise ValueError("Unknown model type '{}', use one of {}".format(model_type, list(detectors)))
+    return detectors[model_type].capabilities
+
+
+register_detector('HOG', "Using CV2 Hog Detector", 'gymnoscamera.hog_detector', 'HogDetector',
+                  DetectorCapabilities(batching=False, input_size=None, input_dtype='uint8',
+                                       resizable_input=False, thread_safe=True, needs_warm_up=False))
+register_detector('YOLOV3', "Using Yolo V3", 'gymnoscamera.yolo_network.yolo_v3', 'YOLO',
+                  DetectorCapabilities(batching=True, input_size=(256, 256), input_dtype='float32',
+                                       resizable_input=True, thread_safe=False, needs_warm_up=True))
+register_detector('YOLOV3RT', "Using Yolo V3 RT", 'gymnoscamera.yolo_network_rt.yolo_v3_rt', 'Yolo_v3_rt',
+                  DetectorCapabilities(batching=True, input_size=(256, 256), input_dtype='float32',
+                                       resizable_input=True, thread_safe=False, needs_warm_up=True))
+register_detector('YOLOV3DNN', "Using Yolo V3 on OpenCV DNN", 'gymnoscamera.yolo_network_dnn.yolo_v3_dnn',
+                  'Yolo_v3_dnn',
+                  DetectorCapabilities(batching=False, input_size=(256, 256), input_dtype='float32',
+                                       resizable_input=False, thread_safe=False, needs_warm_up=True))
+register_detector('YOLOV3TFLITE', "Using Yolo V3 on TFLite", 'gymnoscamera.yolo_network_tflite.yolo_v3_tflite',
+                  'Yolo_v3_tflite',
+                  DetectorCapabilities(batching=False, input_size=None, input_dtype='float32',
+                                       resizable_input=False, thread_safe=False, needs_warm_up=True))
 
 
 class Predictors:
@@ -11,38 +78,98 @@ class Predictors:
     https://drive.google.com/drive/folders/1fibgr4c2CUMItWOngjTxwhqSzsHXBXvT
     and place it in a location that you will provide as an argument to run_camera.py
     """
-    def __init__(self, model_type, model_path: str):
-        if model_type == 'HOG':
-            logging.info("Using CV2 Hog Detector")
-            self.model = cv2.HOGDescriptor()
-            self.model.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
-        elif model_type == "YOLOV3":
-            logging.info("Using Yolo V3")
-            import gymnoscamera.yolo_network.yolo_v3 as yolo
-            self.model = yolo.YOLO(model_path=model_path)
-        elif model_type == "YOLOV3RT":
-            logging.info("Using Yolo V3 RT")
-            import gymnoscamera.yolo_network_rt.yolo_v3_rt as yolort
-            self.model = yolort.Yolo_v3_rt()
-
-    def hog_detector(self, to_predict):
-        """
-        Takes in a frame, runs it through the HOG Detector  and returns the results
+    def __init__(self, model_type, model_path: str, input_size: tuple = None):
+        """
+        :param model_type: type of model to load, one of the registered detectors
+        :param model_path: path to the model
+        :param input_size: (width, height) of the network input, defaults to the model's
+        """
+        backend = detectors.get(model_type)
+        if backend is None:
+            raise ValueError("Unknown model type '{}', use one of {}".format(model_type, list(detectors)))
 
-        :param to_predict: The frame passed into the model
-        :return: frame after it is processed
+        model_args = {}
+        if input_size is not None:
+            model_args['model_image_size'] = (input_size[1], input_size[0])
+
+        logging.info(backend.description)
+        model_class = getattr(importlib.import_module(backend.module), backend.class_name)
+        self.model = model_class(model_path=model_path, **model_args)
+        self.model_type = model_type
+        self.capabilities = backend.capabilities
+
+        # Models which are not thread safe are only ever called by one thread at a time
+        self.lock = None if self.capabilities.thread_safe else threading.Lock()
+
+        if self.capabilities.needs_warm_up:
+            self.warm_up()
+
+    def warm_up(self):
+        """
+        Runs a blank frame through the model so the first real frame is not slowed down
         """
-        start = timer()
-        (rects, weights) = self.model.detectMultiScale(to_predict, winStride=(4, 4), padding=(8, 8), scale=1.05)
-        for (x, y, w, h) in rects:
-            cv2.rectangle(to_predict, (x, y), (x + w, y + h), (0, 0, 255), 2)
-        end = timer()
-        print(end - start)
+        (width, height) = self.get_input_size() or (256, 256)
+        self.run_prediction(np.zeros((height, width, 3), dtype=np.uint8))
+        logging.info("Model warmed up")
 
-        return to_predict
+    def get_input_size(self):
+        """
+        Returns the (width, height) of the network input, None if the model takes any size
+        """
+        return self.model.get_input_size()
 
-    def run_prediction(self, to_predict):
+    def close(self):
+        """
+        Frees the model, for backends which hold more than their Python objects
+        """
+        if hasattr(self.model, 'close'):
+            self.model.close()
+
+    def run_prediction(self, to_predict, network_input=None):
         """
         Run prediction on Frame
+
+        :param to_predict: The frame passed into the model
+        :param network_input: LetterboxInput the model can reuse for its input
+        :return: (N, 4) int32 array of coordinates
+        """
+        if self.lock is None:
+            return self.model.detect_image(to_predict, network_input)
+        with self.lock:
+            return self.model.detect_image(to_predict, network_input)
+
+    def run_prediction_batch(self, frames, letterbox=True):
+        """
+        Run prediction on a list of frames, running the model once for the
+        whole batch when it supports batching
+
+        :param frames: list of frames
+        :param letterbox: letterbox the frames to the network input size, otherwise
+                          they go in at their own size
+        :return: list of (N, 4) int32 arrays of coordinates, one for each frame
         """
-        return np.asarray(self.model.detect_image(to_predict))
+        if not self.capabilities.batching:
+            return [self.run_prediction(frame) for frame in frames]
+
+        if self.lock is None:
+            return self.detect_images(frames, letterbox)
+        with self.lock:
+            return self.detect_images(frames, letterbox)
+
+    def detect_images(self, frames, letterbox):
+        if letterbox:
+            # Letterboxed frames of any size share the network input
+            return self.model.detect_images(frames, letterbox)
+
+        # Frames only go in at their own size if they share a shape
+        groups = {}
+        for i, frame in enumerate(frames):
+            groups.setdefault(frame.shape, []).append(i)
+
+        results = [None] * len(frames)
+        for indices in groups.values():
+            batch_coords = self.model.detect_images([frames[i] for i in indices], letterbox)
+            for i, list_of_coords in zip(indices, batch_coords):
+                results[i] = list_of_coords
+
+        return results
@@ -0,0 +1,138 @@
+import collections
+import logging
+import time
+
+import cv2
+import numpy as np
+
+
+def perceptual_hash(image, hash_size: int = 16):
+    """
+    Difference hash of a frame: the frame is shrunk to hash_size rows and
+    each bit records whether a pixel is brighter than its left neighbour
+
+    :param image: BGR uint8 frame
+    :param hash_size: rows and columns of the hash
+    :return: hash_size * hash_size bits packed into a uint8 array
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+class ResultCache:
+    """
+    Remembers the people found on recent frames by a perceptual hash of the
+    frame, so a scene which does not change, like an empty gym at night,
+    does not go through the predictor again.
+
+    A frame hits when its hash is within max_distance bits of a cached one.
+    Entries expire max_age seconds after the predictor ran, which forces a
+    fresh prediction every so often, and the least recently hit entry is
+    dropped when the cache is full.
+    """
+
+    def __init__(self, hash_size: int = 16, max_distance: int = 8, max_age: float = 60, max_entries: int = 16):
+        """
+        :param hash_size: rows and columns of the frame hash
+        :param max_distance: most bits a frame's hash may differ by to reuse a result
+        :param max_age: seconds a result is reused for
+        :param max_entries: most results to keep
+        """
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        # frame hash bytes -> (frame hash, coordinates, time stored), least recently hit first
+        self.entries = collections.OrderedDict()
+        self.last_hash = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def lookup(self, image):
+        """
+        Returns the cached people of a frame like this one
+
+        :param image: frame about to go through the predictor
+        :return: coordinates of each person, None on a miss
+        """
+        self.last_hash = perceptual_hash(image, self.hash_size)
+
+        now = time.time()
+        for key in [key for key, (_, _, stored) in self.entries.items() if now - stored > self.max_age]:
+            del self.entries[key]
+            self.expired += 1
+
+        if self.entries:
+            keys = list(self.entries)
+            hashes = np.stack([self.entries[key][0] for key in keys])
+            distances = np.unpackbits(np.bitwise_xor(hashes, self.last_hash), axis=1).sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.max_distance:
+                self.hits += 1
+                self.entries.move_to_end(keys[best])
+                return self.entries[keys[best]][1]
+
+        self.misses += 1
+        return None
+
+    def store(self, people_coords):
+        """
+        Caches the people the predictor found on the frame last looked up
+        """
+        self.entries[self.last_hash.tobytes()] = (self.last_hash, people_coords, time.time())
+        self.entries.move_to_end(self.last_hash.tobytes())
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_hit_rate(self):
+        """
+        Returns the fraction of lookups which skipped the predictor
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def log_stats(self):
+        logging.info("Result cache hits: {}, misses: {} ({:.1%} hit rate), expired: {}, entries: {}"
+                     .format(self.hits, self.misses, self.get_hit_rate(), self.expired, len(self.entries)))
+
+
+class CachedPredictor:
+    """
+    Runs a predictor only on frames the ResultCache has no result for
+    """
+
+    def __init__(self, predictor, result_cache: ResultCache):
+        """
+        :param predictor: the predictor to run on misses
+        :param result_cache: the cache of results
+        """
+        self.predictor = predictor
+        self.result_cache = result_cache
+
+    def run_prediction(self, to_predict, network_input=None):
+        """
+        Run prediction on Frame, unless a frame like it is cached
+
+        :param to_predict: The frame passed into the model
+        :param network_input: LetterboxInput the model can reuse for its input
+        :return: coordinates of each person
+        """
+        people_coords = self.result_cache.lookup(to_predict)
+        if people_coords is None:
+            people_coords = self.predictor.run_prediction(to_predict, network_input)
+            self.result_cache.store(people_coords)
+
+        return people_coords
+
+    def get_input_size(self):
+        return self.predictor.get_input_size()
+
+    def run_prediction_batch(self, frames, letterbox=True):
+        return [self.run_prediction(frame) for frame in frames]
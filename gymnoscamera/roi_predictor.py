@@ -0,0 +1,182 @@
+import logging
+
+import cv2
+import numpy as np
+
+# YOLO inputs have to be a multiple of the network stride
+ROI_ALIGNMENT = 32
+
+
+def get_station_boxes(stations, padding: int):
+    """
+    Returns the padded rectangle of each station as (x1, y1, x2, y2)
+
+    :param stations: Machine objects
+    :param padding: pixels added on each side of a station
+    :return: [(x1, y1, x2, y2)]
+    """
+    boxes = []
+    for station in stations:
+        x1 = min(station.top_x, station.bottom_x) - padding
+        y1 = min(station.left_y, station.right_y) - padding
+        x2 = max(station.top_x, station.bottom_x) + padding
+        y2 = max(station.left_y, station.right_y) + padding
+        boxes.append((x1, y1, x2, y2))
+
+    return boxes
+
+
+def box_area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def union_box(box_a, box_b):
+    return min(box_a[0], box_b[0]), min(box_a[1], box_b[1]), max(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+
+
+def cluster_boxes(boxes, max_clusters: int):
+    """
+    Greedily merges boxes into at most max_clusters boxes, always merging
+    the pair whose union adds the least area. Pairs whose union adds no area
+    are merged even when under the limit.
+
+    :param boxes: [(x1, y1, x2, y2)]
+    :param max_clusters: maximum number of boxes to return
+    :return: [(x1, y1, x2, y2)]
+    """
+    clusters = list(boxes)
+    while len(clusters) > 1:
+        best = None
+        for i in range(len(clusters)):
+            for j in range(i + 1, len(clusters)):
+                merged = union_box(clusters[i], clusters[j])
+                cost = box_area(merged) - box_area(clusters[i]) - box_area(clusters[j])
+                if best is None or cost < best[0]:
+                    best = (cost, i, j, merged)
+
+        cost, i, j, merged = best
+        if len(clusters) <= max_clusters and cost > 0:
+            break
+        clusters[i] = merged
+        del clusters[j]
+
+    return clusters
+
+
+def align_box(box, frame_width: int, frame_height: int):
+    """
+    Grows a box so its sides are a multiple of ROI_ALIGNMENT and moves it to
+    lie inside the frame
+
+    :return: (x1, y1, x2, y2)
+    """
+    def align_axis(start, end, limit):
+        size = -(-(end - start) // ROI_ALIGNMENT) * ROI_ALIGNMENT
+        size = min(max(size, ROI_ALIGNMENT), limit - limit % ROI_ALIGNMENT)
+        start = int(min(max(0, start - (size - (end - start)) // 2), limit - size))
+        return start, start + size
+
+    x1, x2 = align_axis(box[0], box[2], frame_width)
+    y1, y2 = align_axis(box[1], box[3], frame_height)
+
+    return x1, y1, x2, y2
+
+
+class RoiPredictor:
+    """
+    Runs a predictor only on crops of the frame around the configured
+    stations and maps the boxes back into frame coordinates.
+
+    The station rectangles are padded, merged into a few clusters and grown
+    to the network alignment. Crops can be taken from the full resolution
+    frame the camera captured, which helps with people at far stations.
+    """
+
+    def __init__(self, predictor, stations, frame_width: int, frame_height: int, padding: int = 32,
+                 max_rois: int = 2, get_native_frame=None, max_native_side: int = 416):
+        """
+        :param predictor: the Predictors to run on each crop
+        :param stations: Machine objects the crops are built around
+        :param frame_width: width of the frames the stations are defined on
+        :param frame_height: height of the frames the stations are defined on
+        :param padding: pixels added on each side of a station
+        :param max_rois: maximum number of crops per frame
+        :param get_native_frame: callable returning the full resolution version of the frame being predicted on
+        :param max_native_side: largest side of a crop taken from a native resolution frame
+        """
+        self.predictor = predictor
+        self.get_native_frame = get_native_frame
+        self.max_native_side = max_native_side
+
+        boxes = cluster_boxes(get_station_boxes(stations, padding), max_rois)
+        self.rois = [align_box(box, frame_width, frame_height) for box in boxes]
+
+        covered = sum(box_area(roi) for roi in self.rois)
+        logging.info("Running predictions on {} regions covering {:.0%} of the frame: {}"
+                     .format(len(self.rois), covered / float(frame_width * frame_height), self.rois))
+
+    def get_crops(self, image, native_image=None):
+        """
+        Crops each region out of the frame
+
+        :param image: frame the stations are defined on
+        :param native_image: the same frame at the resolution it was captured at
+        :return: [(crop, x_offset, y_offset, x_scale, y_scale)]
+        """
+        crops = []
+        if native_image is None:
+            for (x1, y1, x2, y2) in self.rois:
+                crops.append((image[y1:y2, x1:x2], x1, y1, 1.0, 1.0))
+            return crops
+
+        x_ratio = native_image.shape[1] / float(image.shape[1])
+        y_ratio = native_image.shape[0] / float(image.shape[0])
+        for (x1, y1, x2, y2) in self.rois:
+            crop = native_image[int(y1 * y_ratio):int(y2 * y_ratio), int(x1 * x_ratio):int(x2 * x_ratio)]
+
+            # Keep the crop within the network budget, aligned to the network stride
+            scale = min(1.0, self.max_native_side / float(max(crop.shape[:2])))
+            crop_width = max(ROI_ALIGNMENT, int(crop.shape[1] * scale) // ROI_ALIGNMENT * ROI_ALIGNMENT)
+            crop_height = max(ROI_ALIGNMENT, int(crop.shape[0] * scale) // ROI_ALIGNMENT * ROI_ALIGNMENT)
+            crop = cv2.resize(crop, (crop_width, crop_height))
+
+            crops.append((crop, x1, y1, (x2 - x1) / float(crop_width), (y2 - y1) / float(crop_height)))
+
+        return crops
+
+    def map_to_frame(self, list_of_coords, x_offset, y_offset, x_scale, y_scale):
+        """
+        Maps boxes found in a crop back into frame coordinates
+        """
+        coords = np.asarray(list_of_coords, dtype=np.float32).reshape(-1, 4)
+        coords *= (x_scale, y_scale, x_scale, y_scale)
+        coords += (x_offset, y_offset, x_offset, y_offset)
+
+        return np.floor(coords + 0.5).astype(np.int32)
+
+    def run_prediction(self, to_predict, network_input=None):
+        """
+        Run prediction on the station regions of a frame
+
+        :param to_predict: frame the stations are defined on
+        :param network_input: unused, each crop goes in at its own size
+        :return: coordinates of each person in frame coordinates
+        """
+        native_image = None
+        if self.get_native_frame is not None:
+            native_image = self.get_native_frame()
+
+        crops = self.get_crops(to_predict, native_image)
+        batch_coords = self.predictor.run_prediction_batch([crop for crop, _, _, _, _ in crops], letterbox=False)
+
+        list_of_coords = [self.map_to_frame(coords, *crop[1:]) for crop, coords in zip(crops, batch_coords)]
+        if not list_of_coords:
+            return np.zeros((0, 4), dtype=np.int32)
+
+        return np.concatenate(list_of_coords)
+
+    def get_input_size(self):
+        return None
+
+    def run_prediction_batch(self, frames, letterbox=True):
+        return [self.run_prediction(frame) for frame in frames]
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class StationIndex:
+    """
+    Uniform grid over the station rectangles, so a person is only checked
+    against the stations near them instead of every station in the frame.
+
+    Each station is listed in every cell its rectangle covers. A query
+    returns the stations listed in the cells a person's box covers, which
+    includes every station the box overlaps. The cells are held as flat
+    arrays, so all of a frame's people are looked up in a few NumPy calls.
+    The grid is built once and has to be rebuilt if the stations change.
+    """
+
+    def __init__(self, boxes, cell_size: int = None):
+        """
+        :param boxes: (stations, 4) array of (x1, y1, x2, y2) station rectangles
+        :param cell_size: side of a grid cell in pixels, defaults to the median station side
+        """
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.boxes = np.stack([np.minimum(boxes[:, 0], boxes[:, 2]), np.minimum(boxes[:, 1], boxes[:, 3]),
+                               np.maximum(boxes[:, 0], boxes[:, 2]), np.maximum(boxes[:, 1], boxes[:, 3])], axis=1)
+
+        if cell_size is None:
+            sides = np.concatenate([self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1]])
+            cell_size = int(np.median(sides)) if len(sides) else 1
+        self.cell_size = max(1, cell_size)
+
+        # Cells the stations cover, queries are clipped to them
+        cells = self.boxes // self.cell_size
+        self.first_cell = cells[:, :2].min(axis=0) if len(cells) else np.zeros(2, dtype=np.int32)
+        last_cell = cells[:, 2:].max(axis=0) if len(cells) else -np.ones(2, dtype=np.int32)
+        (self.grid_width, self.grid_height) = last_cell - self.first_cell + 1
+        cells = cells - np.tile(self.first_cell, 2)
+
+        # The stations of cell i are cell_stations[cell_starts[i]:cell_starts[i + 1]]
+        station_cells = [[] for _ in range(self.grid_width * self.grid_height)]
+        for station_index, (x1, y1, x2, y2) in enumerate(cells.tolist()):
+            for cell_y in range(y1, y2 + 1):
+                for cell_x in range(x1, x2 + 1):
+                    station_cells[cell_y * self.grid_width + cell_x].append(station_index)
+        self.cell_counts = np.array([len(stations) for stations in station_cells], dtype=np.intp)
+        self.cell_starts = np.concatenate([[0], np.cumsum(self.cell_counts)]).astype(np.intp)
+        self.cell_stations = np.array([i for stations in station_cells for i in stations], dtype=np.intp)
+        self.station_count = len(self.boxes)
+
+    def get_candidates(self, boxes):
+        """
+        Pairs each box with the stations it may overlap, for every box at once
+
+        :param boxes: (N, 4) array of (x1, y1, x2, y2)
+        :return: (box indices, station indices) of the candidate pairs
+        """
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+        # Cell range of each box, empty if it misses the grid
+        cells = boxes // self.cell_size - np.tile(self.first_cell, 2)
+        x1 = np.maximum(cells[:, 0], 0)
+        y1 = np.maximum(cells[:, 1], 0)
+        columns = np.clip(np.minimum(cells[:, 2], self.grid_width - 1) - x1 + 1, 0, None)
+        rows = np.clip(np.minimum(cells[:, 3], self.grid_height - 1) - y1 + 1, 0, None)
+
+        # Every cell of every box
+        cell_totals = columns * rows
+        cell_boxes = np.repeat(np.arange(len(boxes)), cell_totals)
+        offsets = np.arange(cell_totals.sum()) - np.repeat(np.cumsum(cell_totals) - cell_totals, cell_totals)
+        box_columns = columns[cell_boxes]
+        cell_ids = (y1[cell_boxes] + offsets // box_columns) * self.grid_width + x1[cell_boxes] + offsets % box_columns
+
+        # Every station of those cells
+        counts = self.cell_counts[cell_ids]
+        pair_boxes = np.repeat(cell_boxes, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_stations = self.cell_stations[np.repeat(self.cell_starts[cell_ids], counts) + offsets]
+
+        # A station spanning several cells of a box is only paired with it once
+        pairs = np.unique(pair_boxes * self.station_count + pair_stations)
+        return pairs // self.station_count, pairs % self.station_count
@@ -0,0 +1,237 @@
+import time
+
+import numpy as np
+
+from gymnoscamera import occupancy
+from gymnoscamera.station_index import StationIndex
+
+# Below this many stations checking every pair is cheaper than the index, where
+# get_crossover puts it for 10 to 20 people on a 1080p frame
+INDEX_THRESHOLD = 1500
+
+
+class StationSet:
+    """
+    Checks every person against every station at once.
+
+    The station rectangles, paddings and occupancy policies are held in
+    NumPy arrays, so which people are inside which stations is a few
+    broadcasts over every (person, station) pair, one for each policy in
+    use, instead of a check for each pair. With many stations a
+    StationIndex narrows each person down to the stations near them first.
+
+    Only stations somebody is in, or was in a moment ago, have their usage
+    updated, the rest have nothing to update.
+
+    The arrays and the index have to be rebuilt if the stations change.
+    """
+
+    def __init__(self, stations: list, index_threshold: int = INDEX_THRESHOLD):
+        """
+        :param stations: the Machine objects to account usage for
+        :param index_threshold: least number of stations to build a StationIndex for
+        """
+        self.stations = stations
+        self.index_threshold = index_threshold
+        self.boxes = None
+        self.padding = None
+        self.thresholds = None
+        self.polygons = None
+        self.policies = {}
+        self.station_policies = None
+        self.index = None
+        self.active = set()
+        self.build()
+
+    def build(self):
+        """
+        Copies the stations into the arrays and indexes them
+        """
+        self.boxes = np.array([(station.top_x, station.left_y, station.bottom_x, station.right_y)
+                               for station in self.stations], dtype=np.int32).reshape(-1, 4)
+        self.padding = np.array([station.padding for station in self.stations], dtype=np.int32)
+        self.thresholds = np.array([station.occupancy_threshold for station in self.stations], dtype=np.float64)
+        self.polygons = occupancy.get_polygons(self.stations)
+
+        # policy -> (stations using it, their boxes, padding, thresholds, polygons)
+        self.station_policies = np.array([occupancy.POLICIES.index(station.occupancy_policy)
+                                          for station in self.stations], dtype=np.intp)
+        self.policies = {}
+        for policy_id in np.unique(self.station_policies).tolist():
+            columns = np.flatnonzero(self.station_policies == policy_id)
+            self.policies[occupancy.POLICIES[policy_id]] = (columns, self.boxes[columns], self.padding[columns],
+                                                            self.thresholds[columns], self.polygons[columns])
+
+        self.index = None
+        if self.stations and len(self.stations) >= self.index_threshold:
+            # Everything a person has to overlap to be in a station
+            padding = self.padding[:, np.newaxis]
+            extents = np.concatenate([np.minimum(self.boxes[:, :2], self.boxes[:, 2:]) - padding,
+                                      np.maximum(self.boxes[:, :2], self.boxes[:, 2:]) + padding], axis=1)
+            extents[:, :2] = np.minimum(extents[:, :2], self.polygons.min(axis=1))
+            extents[:, 2:] = np.maximum(extents[:, 2:], self.polygons.max(axis=1))
+            self.index = StationIndex(extents)
+
+        self.active = set(i for i, station in enumerate(self.stations) if station.inside)
+
+    def get_occupancy(self, people_coords):
+        """
+        Checks which people are inside which stations, each station by its
+        occupancy policy
+
+        :param people_coords: (N, 4) coordinates of each person
+        :return: (people, stations) bool array
+        """
+        people = np.asarray(people_coords, dtype=np.int32).reshape(-1, 1, 4)
+
+        matrix = np.zeros((len(people), len(self.stations)), dtype=bool)
+        for policy, (columns, boxes, padding, thresholds, polygons) in self.policies.items():
+            matrix[:, columns] = occupancy.OCCUPANCY_CHECKS[policy](people, boxes, padding, thresholds, polygons)
+
+        return matrix
+
+    def check_candidates(self, people):
+        """
+        Checks each person only against the stations the index finds near them
+
+        :param people: (N, 4) coordinates of each person
+        :return: indices of the stations somebody is inside, with repeats
+        """
+        person_indices, station_indices = self.index.get_candidates(people)
+        pair_policies = self.station_policies[station_indices]
+
+        occupied = []
+        for policy in self.policies:
+            pairs = pair_policies == occupancy.POLICIES.index(policy)
+            stations = station_indices[pairs]
+            polygons = self.polygons[stations] if policy == occupancy.FOOT_POINT else None
+            inside = occupancy.OCCUPANCY_CHECKS[policy](people[person_indices[pairs]], self.boxes[stations],
+                                                        self.padding[stations], self.thresholds[stations], polygons)
+            occupied.append(stations[inside])
+
+        return np.concatenate(occupied) if occupied else np.zeros(0, dtype=np.intp)
+
+    def get_occupied(self, people_coords):
+        """
+        Checks which stations have at least one person inside
+
+        :param people_coords: (N, 4) coordinates of each person
+        :return: bool array with an entry for each station
+        """
+        if self.index is None:
+            return self.get_occupancy(people_coords).any(axis=0)
+
+        occupied = np.zeros(len(self.stations), dtype=bool)
+        occupied[self.check_candidates(np.asarray(people_coords, dtype=np.int32).reshape(-1, 4))] = True
+        return occupied
+
+    def increment_machine_time(self, people_coords, image_cap_time):
+        """
+        Updates the usage of every station with the people in a frame
+
+        :param people_coords: (N, 4) coordinates of each person
+        :param image_cap_time: The exact time the image was captured on
+        """
+        occupied = self.get_occupied(people_coords)
+
+        stations = self.stations
+        active = self.active
+        for i in sorted(active.union(np.flatnonzero(occupied).tolist())):
+            station = stations[i]
+            station.update_usage(bool(occupied[i]), image_cap_time)
+            if station.inside:
+                active.add(i)
+            else:
+                active.discard(i)
+
+
+class BenchmarkStation:
+    """
+    Stand-in for Machine with only what StationSet uses
+    """
+
+    def __init__(self, top_x, left_y, bottom_x, right_y):
+        self.top_x = top_x
+        self.left_y = left_y
+        self.bottom_x = bottom_x
+        self.right_y = right_y
+        self.padding = 10
+        self.inside = False
+        self.occupancy_policy = occupancy.CONTAINMENT
+        self.occupancy_threshold = 0.0
+        self.polygon = None
+
+    def update_usage(self, person_inside, image_cap_time):
+        self.inside = person_inside
+
+    def check_inside(self, person):
+        return person[0] + self.padding >= self.top_x and person[1] + self.padding >= self.left_y \
+            and person[2] - self.padding <= self.bottom_x and person[3] - self.padding <= self.right_y
+
+
+def benchmark(station_counts=(10, 100, 500, 1000, 1500, 2000, 5000, 10000), people: int = 10, frames: int = 200,
+              frame_width: int = 1920, frame_height: int = 1080):
+    """
+    Times a frame of accounting with stations tiled over a wide frame, for a
+    loop over every pair, the all pairs broadcast and the index
+
+    :return: [(stations, loop ms, broadcast ms, index ms)]
+    """
+    rng = np.random.RandomState(0)
+    results = []
+    for count in station_counts:
+        columns = int(np.ceil(np.sqrt(count * frame_width / float(frame_height))))
+        rows = int(np.ceil(count / float(columns)))
+        width, height = frame_width // columns, frame_height // rows
+        stations = [BenchmarkStation(x * width, y * height, (x + 1) * width - 4, (y + 1) * height - 4)
+                    for y in range(rows) for x in range(columns)][:count]
+
+        # People about the size of a station, so some of them are inside one
+        frame_people = []
+        for _ in range(frames):
+            corners = rng.randint(0, [frame_width, frame_height], size=(people, 2))
+            sizes = rng.randint([width // 2, height // 2], [width + 1, height + 1], size=(people, 2))
+            frame_people.append(np.concatenate([corners, corners + sizes], axis=1).astype(np.int32))
+
+        def time_frames(account):
+            start = time.perf_counter()
+            for people_coords in frame_people:
+                account(people_coords)
+            return (time.perf_counter() - start) * 1000 / frames
+
+        def loop(people_coords):
+            for station in stations:
+                station.update_usage(any(station.check_inside(person) for person in people_coords.tolist()), 0)
+
+        broadcast = StationSet(stations, index_threshold=count + 1)
+        indexed = StationSet(stations, index_threshold=0)
+        results.append((count, time_frames(loop),
+                        time_frames(lambda people_coords: broadcast.increment_machine_time(people_coords, 0)),
+                        time_frames(lambda people_coords: indexed.increment_machine_time(people_coords, 0))))
+
+    return results
+
+
+def get_crossover(results):
+    """
+    Returns the fewest stations from which the index is faster than the
+    broadcast at every larger count benchmarked, None if it never is
+
+    :param results: what benchmark returned
+    """
+    crossover = None
+    for count, _, broadcast_ms, index_ms in results:
+        if index_ms >= broadcast_ms:
+            crossover = None
+        elif crossover is None:
+            crossover = count
+    return crossover
+
+
+if __name__ == '__main__':
+    results = benchmark()
+    print("| Stations | Loop (ms) | Broadcast (ms) | Index (ms) |")
+    print("| --- | --- | --- | --- |")
+    for row in results:
+        print("| {} | {:.3f} | {:.3f} | {:.3f} |".format(*row))
+    print("Index faster from {} stations, INDEX_THRESHOLD is {}".format(get_crossover(results), INDEX_THRESHOLD))
@@ -0,0 +1,157 @@
+import atexit
+import logging
+import threading
+import time
+
+
+class StatusPublisher:
+    """
+    Saves whether machines are open from a background thread, so the frame
+    loop never waits on the database.
+
+    A status change waits debounce seconds before it is saved and the last
+    status requested in that window wins, so a machine flickering between
+    open and in use is saved at most once per window. Nothing is saved when
+    the status ends up where it was last saved. Stopping the publisher
+    saves everything still waiting straight away.
+    """
+
+    def __init__(self, debounce: float = 1.0):
+        """
+        :param debounce: seconds a status change waits for later changes before it is saved
+        """
+        self.debounce = debounce
+
+        # machine id -> [machine model, requested status, time the first request of the window was made]
+        self.pending = {}
+        # machine id -> last status saved
+        self.published = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+
+        # Counters
+        self.requests = 0
+        self.saves = 0
+        self.skipped = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.stopping = False
+            self.thread = threading.Thread(target=self.run, name="status publisher", daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 30):
+        """
+        Saves the statuses still waiting and stops the worker
+
+        :param timeout: most seconds to wait for the saves
+        """
+        with self.condition:
+            thread = self.thread
+            self.thread = None
+            self.stopping = True
+            self.condition.notify()
+        if thread is None:
+            return
+
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.info("Status publisher still busy after {} seconds".format(timeout))
+        self.log_stats()
+
+    def publish(self, model, is_open: bool):
+        """
+        Requests a machine's status to be saved, returns straight away
+
+        :param model: the machine model to save
+        :param is_open: True if nobody is using the machine
+        """
+        self.start()
+
+        with self.condition:
+            self.requests += 1
+            # The status the model was loaded with counts as saved
+            self.published.setdefault(model.id, model.open)
+
+            entry = self.pending.get(model.id)
+            if entry is None:
+                self.pending[model.id] = [model, is_open, time.time()]
+                self.condition.notify()
+            else:
+                entry[1] = is_open
+
+    def get_due(self):
+        """
+        Waits for statuses whose debounce window has passed
+
+        :return: (list of (model, status), True if the publisher was stopped)
+        """
+        with self.condition:
+            while True:
+                now = time.time()
+                if self.stopping:
+                    due = list(self.pending)
+                else:
+                    due = [machine_id for machine_id, (_, _, requested) in self.pending.items()
+                           if now - requested >= self.debounce]
+                if due or self.stopping:
+                    return [tuple(self.pending.pop(machine_id)[:2]) for machine_id in due], self.stopping
+
+                timeout = None
+                if self.pending:
+                    timeout = min(requested for _, _, requested in self.pending.values()) + self.debounce - now
+                self.condition.wait(timeout)
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            due, stopped = self.get_due()
+            for model, is_open in due:
+                self.save(model, is_open)
+
+    def save(self, model, is_open: bool):
+        """
+        Saves a machine's status unless it is already saved
+        """
+        if self.published.get(model.id) == is_open:
+            self.skipped += 1
+            return
+
+        start = time.time()
+        try:
+            model.open = is_open
+            model.save()
+        except Exception as e:
+            self.failures += 1
+            logging.info("Could not save the status of {}: {}".format(model.id, str(e)))
+            return
+
+        latency = time.time() - start
+        self.published[model.id] = is_open
+        self.saves += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def get_mean_latency(self):
+        """
+        Returns the mean seconds a save took
+        """
+        if self.saves == 0:
+            return 0.0
+        return self.total_latency / self.saves
+
+    def log_stats(self):
+        logging.info("Status publisher saved {} of {} requests, {} unchanged, {} failed, "
+                     "latency mean: {:.0f} ms, max: {:.0f} ms"
+                     .format(self.saves, self.requests, self.skipped, self.failures,
+                             self.get_mean_latency() * 1000, self.max_latency * 1000))
+
+
+publisher = StatusPublisher()
@@ -0,0 +1,253 @@
+import logging
+
+import numpy as np
+
+from gymnoscamera.yolo_network.postprocess import box_ious
+
+# Constant velocity model over [center x, center y, area, aspect ratio] and the
+# velocities of the first three, one step per frame
+STATE_SIZE = 7
+TRANSITION = np.eye(STATE_SIZE)
+TRANSITION[0, 4] = TRANSITION[1, 5] = TRANSITION[2, 6] = 1
+MEASUREMENT = np.eye(4, STATE_SIZE)
+MEASUREMENT_NOISE = np.diag([1., 1., 10., 10.])
+PROCESS_NOISE = np.diag([1., 1., 1., 1., .01, .01, .0001])
+INITIAL_COVARIANCE = np.diag([10., 10., 10., 10., 1e4, 1e4, 1e4])
+
+
+def coords_to_measurement(coords):
+    """
+    Converts (left, top, right, bottom) to (center x, center y, area, aspect ratio)
+    """
+    width = max(float(coords[2] - coords[0]), 1.0)
+    height = max(float(coords[3] - coords[1]), 1.0)
+    return np.array([coords[0] + width / 2, coords[1] + height / 2, width * height, width / height])
+
+
+def state_to_coords(state):
+    """
+    Converts a track state back to (left, top, right, bottom)
+    """
+    area = max(state[2], 1.0)
+    width = np.sqrt(area * max(state[3], 1e-3))
+    height = area / width
+    return np.array([state[0] - width / 2, state[1] - height / 2, state[0] + width / 2, state[1] + height / 2])
+
+
+class Track:
+    """
+    A person followed between detections by a Kalman filter
+    """
+
+    def __init__(self, track_id: int, coords):
+        self.track_id = track_id
+        self.state = np.zeros(STATE_SIZE)
+        self.state[:4] = coords_to_measurement(coords)
+        self.covariance = INITIAL_COVARIANCE.copy()
+
+        # Detections in a row the track was not found in
+        self.missed = 0
+
+    def predict(self):
+        """
+        Moves the track on by one frame
+        """
+        # Keep the area from going negative
+        if self.state[2] + self.state[6] <= 0:
+            self.state[6] = 0
+        self.state = TRANSITION.dot(self.state)
+        self.covariance = TRANSITION.dot(self.covariance).dot(TRANSITION.T) + PROCESS_NOISE
+
+    def update(self, coords):
+        """
+        Corrects the track with the detection it was matched to
+        """
+        residual = coords_to_measurement(coords) - MEASUREMENT.dot(self.state)
+        innovation = MEASUREMENT.dot(self.covariance).dot(MEASUREMENT.T) + MEASUREMENT_NOISE
+        gain = self.covariance.dot(MEASUREMENT.T).dot(np.linalg.inv(innovation))
+        self.state = self.state + gain.dot(residual)
+        self.covariance = (np.eye(STATE_SIZE) - gain.dot(MEASUREMENT)).dot(self.covariance)
+        self.missed = 0
+
+    def get_coords(self):
+        return state_to_coords(self.state)
+
+    def get_uncertainty(self):
+        """
+        Returns the standard deviation of the track's position relative to its height
+        """
+        height = self.get_coords()[3] - self.get_coords()[1]
+        return np.sqrt(self.covariance[0, 0] + self.covariance[1, 1]) / max(height, 1.0)
+
+    def get_speed(self):
+        """
+        Returns how far the track moves each frame relative to its height
+        """
+        height = self.get_coords()[3] - self.get_coords()[1]
+        return np.hypot(self.state[4], self.state[5]) / max(height, 1.0)
+
+
+class PeopleTracker:
+    """
+    Follows people between detections with a Kalman filter on each person
+    and IoU matching, so the predictor only has to run every few frames.
+
+    The predictor runs again once interval frames have passed, or earlier
+    when a track's position becomes too uncertain. The interval adapts to
+    the scene: it grows by one frame after every calm detection, and drops
+    to min_interval when people move quickly, appear or disappear.
+
+    Each person keeps the same track id for as long as they are tracked.
+    """
+
+    def __init__(self, min_interval: int = 1, max_interval: int = 10, iou_threshold: float = 0.3,
+                 max_missed: int = 1, slow_speed: float = 0.01, fast_speed: float = 0.05,
+                 max_uncertainty: float = 0.25):
+        """
+        :param min_interval: fewest frames between detections
+        :param max_interval: most frames between detections
+        :param iou_threshold: least overlap for a detection to continue a track
+        :param max_missed: detections in a row a person can be missed in before their track is dropped
+        :param slow_speed: speed, in heights per frame, below which the interval grows
+        :param fast_speed: speed, in heights per frame, above which the interval is halved
+        :param max_uncertainty: position uncertainty, relative to the height, that forces a detection
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.slow_speed = slow_speed
+        self.fast_speed = fast_speed
+        self.max_uncertainty = max_uncertainty
+
+        self.tracks = []
+        self.next_id = 0
+        self.interval = min_interval
+        self.frames_since_detection = 0
+
+        # Counters
+        self.frames = 0
+        self.detections = 0
+        self.uncertainty_triggered = 0
+
+    def predict(self):
+        """
+        Moves every track on to the current frame, call once for every frame
+        """
+        self.frames += 1
+        self.frames_since_detection += 1
+        for track in self.tracks:
+            track.predict()
+
+    def should_detect(self):
+        """
+        Checks whether the predictor has to run on the current frame
+        """
+        if self.frames_since_detection >= self.interval:
+            return True
+
+        for track in self.tracks:
+            if track.missed == 0 and track.get_uncertainty() > self.max_uncertainty:
+                self.uncertainty_triggered += 1
+                return True
+
+        return False
+
+    def match(self, people_coords):
+        """
+        Greedily matches detections to tracks, best overlaps first
+
+        :return: ([(track index, detection index)], unmatched detection indices)
+        """
+        matches = []
+        unmatched = set(range(len(people_coords)))
+        if not self.tracks or not unmatched:
+            return matches, unmatched
+
+        ious = box_ious([track.get_coords() for track in self.tracks], people_coords)
+        while True:
+            i, j = np.unravel_index(np.argmax(ious), ious.shape)
+            if ious[i, j] < self.iou_threshold:
+                return matches, unmatched
+            matches.append((i, j))
+            unmatched.discard(j)
+            ious[i, :] = -1
+            ious[:, j] = -1
+
+    def update(self, people_coords):
+        """
+        Corrects the tracks with the people the predictor found on the current frame
+
+        :param people_coords: (N, 4) array of coordinates from the predictor
+        :return: (N, 4) int32 array of the coordinates of the tracked people
+        """
+        self.detections += 1
+        self.frames_since_detection = 0
+
+        matches, unmatched = self.match(people_coords)
+        matched_tracks = set()
+        for i, j in matches:
+            self.tracks[i].update(people_coords[j])
+            matched_tracks.add(i)
+
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+        lost = [track for track in self.tracks if track.missed > self.max_missed]
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for j in sorted(unmatched):
+            self.tracks.append(Track(self.next_id, people_coords[j]))
+            self.next_id += 1
+
+        self.adapt_interval(len(unmatched) + len(lost) > 0)
+
+        return self.get_coords()
+
+    def adapt_interval(self, changed: bool):
+        """
+        Sets how many frames to wait before the next detection
+
+        :param changed: someone appeared or disappeared in this detection
+        """
+        speed = max([track.get_speed() for track in self.tracks if track.missed == 0] or [0.0])
+        if changed:
+            self.interval = self.min_interval
+        elif speed > self.fast_speed:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif speed < self.slow_speed:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def get_coords(self):
+        """
+        Returns the coordinates of the people found in the last detection,
+        moved on to the current frame
+
+        :return: (N, 4) int32 array of coordinates
+        """
+        tracks = [track for track in self.tracks if track.missed == 0]
+        coords = np.zeros((len(tracks), 4), dtype=np.int32)
+        for i, track in enumerate(tracks):
+            coords[i] = np.floor(track.get_coords() + 0.5)
+
+        return coords
+
+    def get_track_ids(self):
+        """
+        Returns the track id of each person, in the order of get_coords
+        """
+        return [track.track_id for track in self.tracks if track.missed == 0]
+
+    def get_detection_rate(self):
+        """
+        Returns the fraction of frames the predictor ran on
+        """
+        if self.frames == 0:
+            return 0.0
+        return self.detections / self.frames
+
+    def log_stats(self):
+        logging.info("Tracker detected on {} of {} frames ({:.1%}), {} early for uncertain tracks, "
+                     "interval: {}, tracks: {}"
+                     .format(self.detections, self.frames, self.get_detection_rate(), self.uncertainty_triggered,
+                             self.interval, self.get_track_ids()))
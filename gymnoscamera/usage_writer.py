@@ -0,0 +1,172 @@
+import atexit
+import collections
+import datetime
+import logging
+import queue
+import threading
+import time
+
+from gymnos_firestore import usage
+from matchbox.queries.error import DocumentDoesNotExists
+
+# A finished session on a machine
+UsageEvent = collections.namedtuple('UsageEvent', ['station', 'date', 'start', 'end'])
+
+_STOP = object()
+
+
+class UsageWriter:
+    """
+    Writes finished machine sessions to the database from one background
+    thread, instead of a thread for every session.
+
+    Sessions wait in a bounded queue and are written in batches, once
+    max_batch sessions are waiting or flush_period seconds after the first
+    of them arrived. Sessions of the same machine on the same day are
+    coalesced into one read and one write of its Usage document. Stopping
+    the writer writes everything still waiting.
+    """
+
+    def __init__(self, max_queue: int = 1000, max_batch: int = 50, flush_period: float = 5):
+        """
+        :param max_queue: most sessions waiting to be written before submitting blocks
+        :param max_batch: sessions which trigger a write without waiting for flush_period
+        :param flush_period: most seconds a session waits to be written
+        """
+        self.max_batch = max_batch
+        self.flush_period = flush_period
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # Counters
+        self.sessions = 0
+        self.writes = 0
+        self.failures = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name="usage writer", daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 30):
+        """
+        Writes the sessions still waiting and stops the worker
+
+        :param timeout: most seconds to wait for the writes
+        """
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is None:
+            return
+
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.info("Usage writer still busy after {} seconds, {} sessions waiting"
+                         .format(timeout, self.queue.qsize()))
+        self.log_stats()
+
+    def submit(self, station, start, end):
+        """
+        Queues a finished session to be written
+
+        :param station: the Machine the session was on
+        :param start: Start of machine usage in Unix time
+        :param end: End of machine usage in Unix time
+        """
+        self.start()
+
+        event = UsageEvent(station, datetime.date.today().strftime("%Y/%m/%d"), start, end)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logging.info("Usage writer queue is full, waiting for it to drain")
+            self.queue.put(event)
+
+    def next_batch(self):
+        """
+        Waits for the next batch of sessions
+
+        :return: (list of events, True if the writer was stopped)
+        """
+        batch = [self.queue.get()]
+        if batch[0] is _STOP:
+            return [], True
+
+        deadline = time.time() + self.flush_period
+        while len(batch) < self.max_batch:
+            try:
+                event = self.queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+
+        return batch, False
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self.next_batch()
+            if stopped:
+                # Drain whatever was queued behind the stop
+                while True:
+                    try:
+                        event = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is not _STOP:
+                        batch.append(event)
+            if batch:
+                self.write(batch)
+
+    def write(self, batch):
+        """
+        Writes a batch of sessions, one read and write for each machine and day
+        """
+        self.sessions += len(batch)
+
+        sessions = collections.OrderedDict()
+        for event in batch:
+            sessions.setdefault((event.station.model.id, event.date), []).append(event)
+
+        for (machine_id, date), events in sessions.items():
+            try:
+                self.write_usage(events[0].station, date, events)
+            except Exception as e:
+                self.failures += 1
+                logging.info("Could not write usage of {} on {}: {}".format(machine_id, date, str(e)))
+                continue
+            self.writes += 1
+
+    def write_usage(self, station, date, events):
+        """
+        Adds sessions to a machine's Usage document for a day
+        """
+        try:
+            usage_today = usage.Usage.objects.get(machine_id=station.model.id, date=date)
+        except DocumentDoesNotExists:
+            usage_today = usage.Usage()
+            usage_today.date = date
+            usage_today.machine_id = station.model.id
+            usage_today.name = station.model.name
+            usage_today.times = []
+            usage_today.total_time = 0
+
+        for event in events:
+            usage_today.times.append('{}#{}'.format(event.start, event.end))
+            usage_today.total_time += event.end - event.start
+        usage_today.save()
+
+    def log_stats(self):
+        logging.info("Usage writer wrote {} sessions in {} writes, {} failed"
+                     .format(self.sessions, self.writes, self.failures))
+
+
+writer = UsageWriter()
@@ -124,8 +124,10 @@ def tiny_yolo_body(inputs, num_anchors, num_classes):
     return Model(inputs, [y1,y2])
 
 
-def yolo_head(feats, anchors, num_classes, input_shape, calc_loss=False):
-    """Convert final layer features to bounding box parameters."""
+def yolo_head(feats, anchors, num_classes, input_shape, calc_loss=False, class_ids=None):
+    """Convert final layer features to bounding box parameters.
+
+    class_ids: only score these classes, sliced out before the sigmoid."""
     num_anchors = len(anchors)
     # Reshape to batch, height, width, num_anchors, box_params.
     anchors_tensor = K.reshape(K.constant(anchors), [1, 1, 1, num_anchors, 2])
@@ -145,7 +147,10 @@ def yolo_head(feats, anchors, num_classes, input_shape, calc_loss=False):
     box_xy = (K.sigmoid(feats[..., :2]) + grid) / K.cast(grid_shape[::-1], K.dtype(feats))
     box_wh = K.exp(feats[..., 2:4]) * anchors_tensor / K.cast(input_shape[::-1], K.dtype(feats))
     box_confidence = K.sigmoid(feats[..., 4:5])
-    box_class_probs = K.sigmoid(feats[..., 5:])
+    class_feats = feats[..., 5:]
+    if class_ids is not None:
+        class_feats = tf.gather(class_feats, class_ids, axis=-1)
+    box_class_probs = K.sigmoid(class_feats)
 
     if calc_loss == True:
         return grid, feats, box_xy, box_wh
@@ -178,14 +183,14 @@ def yolo_correct_boxes(box_xy, box_wh, input_shape, image_shape):
     return boxes
 
 
-def yolo_boxes_and_scores(feats, anchors, num_classes, input_shape, image_shape):
+def yolo_boxes_and_scores(feats, anchors, num_classes, input_shape, image_shape, class_ids=None):
     '''Process Conv layer output'''
     box_xy, box_wh, box_confidence, box_class_probs = yolo_head(feats,
-        anchors, num_classes, input_shape)
+        anchors, num_classes, input_shape, class_ids=class_ids)
     boxes = yolo_correct_boxes(box_xy, box_wh, input_shape, image_shape)
     boxes = K.reshape(boxes, [-1, 4])
     box_scores = box_confidence * box_class_probs
-    box_scores = K.reshape(box_scores, [-1, num_classes])
+    box_scores = K.reshape(box_scores, [-1, num_classes if class_ids is None else len(class_ids)])
     return boxes, box_scores
 
 
@@ -195,8 +200,12 @@ def yolo_eval(yolo_outputs,
               image_shape,
               max_boxes=20,
               score_threshold=.6,
-              iou_threshold=.5):
-    """Evaluate YOLO model on given input and return filtered boxes."""
+              iou_threshold=.5,
+              class_ids=None):
+    """Evaluate YOLO model on given input and return filtered boxes.
+
+    class_ids: only decode and suppress these classes. The result then has a
+    fixed length of max_boxes per class, padded with zero scores and class -1."""
     num_layers = len(yolo_outputs)
     anchor_mask = [[6,7,8], [3,4,5], [0,1,2]] if num_layers==3 else [[3,4,5], [1,2,3]] # default setting
     input_shape = K.shape(yolo_outputs[0])[1:3] * 32
@@ -204,21 +213,24 @@ def yolo_eval(yolo_outputs,
     box_scores = []
     for l in range(num_layers):
         _boxes, _box_scores = yolo_boxes_and_scores(yolo_outputs[l],
-            anchors[anchor_mask[l]], num_classes, input_shape, image_shape)
+            anchors[anchor_mask[l]], num_classes, input_shape, image_shape, class_ids)
         boxes.append(_boxes)
         box_scores.append(_box_scores)
     boxes = K.concatenate(boxes, axis=0)
     box_scores = K.concatenate(box_scores, axis=0)
 
+    # Column i of box_scores holds class evaluated_classes[i]
+    evaluated_classes = range(num_classes) if class_ids is None else class_ids
+
     mask = box_scores >= score_threshold
     max_boxes_tensor = K.constant(max_boxes, dtype='int32')
     boxes_ = []
     scores_ = []
     classes_ = []
-    for c in range(num_classes):
+    for i, c in enumerate(evaluated_classes):
         # TODO: use keras backend instead of tf.
-        class_boxes = tf.boolean_mask(boxes, mask[:, c])
-        class_box_scores = tf.boolean_mask(box_scores[:, c], mask[:, c])
+        class_boxes = tf.boolean_mask(boxes, mask[:, i])
+        class_box_scores = tf.boolean_mask(box_scores[:, i], mask[:, i])
         nms_index = tf.image.non_max_suppression(
             class_boxes, class_box_scores, max_boxes_tensor, iou_threshold=iou_threshold)
         class_boxes = K.gather(class_boxes, nms_index)
@@ -231,9 +243,44 @@ def yolo_eval(yolo_outputs,
     scores_ = K.concatenate(scores_, axis=0)
     classes_ = K.concatenate(classes_, axis=0)
 
+    if class_ids is not None:
+        # Pad to a fixed shape so the result never changes size
+        padding = max_boxes * len(class_ids) - K.shape(scores_)[0]
+        boxes_ = tf.pad(boxes_, [[0, padding], [0, 0]])
+        scores_ = tf.pad(scores_, [[0, padding]])
+        classes_ = tf.pad(classes_, [[0, padding]], constant_values=-1)
+        boxes_.set_shape([max_boxes * len(class_ids), 4])
+        scores_.set_shape([max_boxes * len(class_ids)])
+        classes_.set_shape([max_boxes * len(class_ids)])
+
     return boxes_, scores_, classes_
 
 
+def yolo_eval_batch(yolo_outputs,
+                    anchors,
+                    num_classes,
+                    image_shapes,
+                    max_boxes=20,
+                    score_threshold=.6,
+                    iou_threshold=.5,
+                    class_ids=None):
+    """Evaluate YOLO model on a batch, mapping each image's boxes back to its own shape.
+
+    image_shapes: (batch, 2) tensor of image heights and widths.
+    Returns boxes, scores and classes of shape (batch, max_boxes * classes, ...),
+    padded with zero scores and class -1."""
+    if class_ids is None:
+        class_ids = list(range(num_classes))
+
+    def eval_image(elems):
+        image_outputs = [K.expand_dims(feats, 0) for feats in elems[:-1]]
+        return yolo_eval(image_outputs, anchors, num_classes, elems[-1], max_boxes=max_boxes,
+                         score_threshold=score_threshold, iou_threshold=iou_threshold, class_ids=class_ids)
+
+    return tf.map_fn(eval_image, tuple(yolo_outputs) + (image_shapes,),
+                     dtype=(K.dtype(yolo_outputs[0]), K.dtype(yolo_outputs[0]), 'int32'))
+
+
 def preprocess_true_boxes(true_boxes, input_shape, anchors, num_classes):
     '''Preprocess true boxes to training input format
 
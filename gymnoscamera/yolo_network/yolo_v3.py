@@ -12,18 +12,24 @@ from keras.layers import Input
 from keras.models import load_model
 from keras.utils import multi_gpu_model
 
-from gymnoscamera.yolo_network.model import yolo_eval, yolo_body, tiny_yolo_body
+from gymnoscamera.frame_buffers import LetterboxInput, letterbox_batch
+from gymnoscamera.yolo_network.model import yolo_eval, yolo_eval_batch, yolo_body, tiny_yolo_body
+from gymnoscamera.yolo_network.postprocess import YoloDecoder, boxes_to_coords
 
 
 class YOLO(object):
     _defaults = {
         "model_path": None,
         "anchors_path": 'model_data/yolo_anchors.txt',
+        "tiny_anchors_path": 'model_data/tiny_yolo_anchors.txt',  # used instead when the model turns out to be tiny
         "classes_path": 'model_data/coco_classes.txt',
         "score": 0.3,
         "iou": 0.45,
         "model_image_size": (256, 256),
         "gpu_num": 1,
+        "detect_classes": ("person",),  # None decodes every class
+        "index_offset": False,  # shrink each box by its detection index like the old per-box loop
+        "numpy_decode": False,  # decode the raw outputs with YoloDecoder instead of the TF graph
         "score_threshold": 0.30
     }
 
@@ -42,9 +48,15 @@ class YOLO(object):
             raise ValueError("Argument 'model_path' must be overridden to use YoloV3!")
 
         self.class_names = self._get_class()
+        self.person_class_ids = [self.class_names.index("person")]
         self.anchors = self._get_anchors()
         self.sess = K.get_session()
+        self.network_input = None
         self.boxes, self.scores, self.classes = self.generate()
+        self.decoder = None
+        if self.numpy_decode:
+            self.decoder = YoloDecoder(self.anchors, self.get_class_ids(), score_threshold=self.score,
+                                       iou_threshold=self.iou)
 
     def _get_class(self):
         classes_path = os.path.expanduser(os.path.join(os.path.dirname(__file__), self.classes_path))
@@ -76,6 +88,12 @@ class YOLO(object):
                 if is_tiny_version else yolo_body(Input(shape=(None, None, 3)), num_anchors // 3, num_classes)
             self.yolo_model.load_weights(self.model_path)  # make sure model, anchors and classes match
         else:
+            # Full models have three outputs and tiny ones two, each with three anchors
+            if num_anchors != 3 * len(self.yolo_model.output):
+                self.anchors_path = self.tiny_anchors_path if len(self.yolo_model.output) == 2 \
+                    else self._defaults["anchors_path"]
+                self.anchors = self._get_anchors()
+                num_anchors = len(self.anchors)
             assert self.yolo_model.layers[-1].output_shape[-1] == \
                    num_anchors / len(self.yolo_model.output) * (num_classes + 5), \
                 'Mismatch between model and given anchor and class sizes'
@@ -99,16 +117,56 @@ class YOLO(object):
             self.yolo_model = multi_gpu_model(self.yolo_model, gpus=self.gpu_num)
         boxes, scores, classes = yolo_eval(self.yolo_model.output, self.anchors,
                                            len(self.class_names), self.input_image_shape,
-                                           score_threshold=self.score, iou_threshold=self.iou)
+                                           score_threshold=self.score, iou_threshold=self.iou,
+                                           class_ids=self.get_class_ids())
+
+        # Batched decode, each image is mapped back to its own shape
+        self.input_image_shapes = K.placeholder(shape=(None, 2))
+        self.batch_boxes, self.batch_scores, self.batch_classes = yolo_eval_batch(
+            self.yolo_model.output, self.anchors, len(self.class_names), self.input_image_shapes,
+            score_threshold=self.score, iou_threshold=self.iou, class_ids=self.get_class_ids())
         return boxes, scores, classes
 
-    def detect_image(self, image):
-        image_data = np.array(image, dtype='float32')
-
-        (image_height, image_width, channels) = image_data.shape
-
-        image_data /= 255.
-        image_data = np.expand_dims(image_data, 0)  # Add batch dimension.
+    def get_class_ids(self):
+        """
+        Returns the indices of the classes the graph decodes, None for all of them
+        """
+        if self.detect_classes is None:
+            return None
+        return [self.class_names.index(name) for name in self.detect_classes]
+
+    def get_input_size(self):
+        """
+        Returns the (width, height) of the network input
+        """
+        return self.model_image_size[1], self.model_image_size[0]
+
+    def detect_image(self, image, network_input=None):
+        """
+        Finds the people in a frame
+
+        :param image: BGR uint8 frame of any size
+        :param network_input: LetterboxInput to reuse for the network input
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        (image_height, image_width, channels) = image.shape
+
+        if network_input is None:
+            if self.network_input is None:
+                self.network_input = LetterboxInput(*self.get_input_size())
+            network_input = self.network_input
+        image_data = network_input.fill(image)
+
+        if self.decoder is not None:
+            feats = self.sess.run(
+                self.yolo_model.output,
+                feed_dict={
+                    self.yolo_model.input: image_data,
+                    K.learning_phase(): 0
+                })
+            out_boxes, out_scores, out_classes = self.decoder.decode(feats, image_data.shape[1:3],
+                                                                     (image_height, image_width))
+            return self.filter_people(out_boxes, out_scores, out_classes, image_height, image_width)
 
         out_boxes, out_scores, out_classes = self.sess.run(
             [self.boxes, self.scores, self.classes],
@@ -118,22 +176,64 @@ class YOLO(object):
                 K.learning_phase(): 0
             })
 
-        list_of_coords = []
-        for i, c in reversed(list(enumerate(out_classes))):
-            predicted_class = self.class_names[c]
-            score = out_scores[i]
+        return self.filter_people(out_boxes, out_scores, out_classes, image_height, image_width)
+
+    def detect_images(self, images, letterbox=True):
+        """
+        Runs the network and the decode once over a batch of images
+
+        :param images: list of BGR uint8 frames
+        :param letterbox: letterbox the frames to the network input size, so they can differ in size,
+                          otherwise they are used at their own size which has to be the same for every
+                          frame and a multiple of 32
+        :return: (N, 4) int32 array of coordinates for each frame
+        """
+        if letterbox:
+            image_data = letterbox_batch(images, *self.get_input_size())
+        else:
+            (image_height, image_width, channels) = images[0].shape
+            image_data = letterbox_batch(images, image_width, image_height)
+        image_shapes = [image.shape[:2] for image in images]
+
+        if self.decoder is not None:
+            feats = self.sess.run(
+                self.yolo_model.output,
+                feed_dict={
+                    self.yolo_model.input: image_data,
+                    K.learning_phase(): 0
+                })
+            results = []
+            for b, (image_height, image_width) in enumerate(image_shapes):
+                out_boxes, out_scores, out_classes = self.decoder.decode([feat[b:b + 1] for feat in feats],
+                                                                         image_data.shape[1:3],
+                                                                         (image_height, image_width))
+                results.append(self.filter_people(out_boxes, out_scores, out_classes, image_height, image_width))
+            return results
+
+        out_boxes, out_scores, out_classes = self.sess.run(
+            [self.batch_boxes, self.batch_scores, self.batch_classes],
+            feed_dict={
+                self.yolo_model.input: image_data,
+                self.input_image_shapes: image_shapes,
+                K.learning_phase(): 0
+            })
+
+        results = []
+        for b, (image_height, image_width) in enumerate(image_shapes):
+            results.append(self.filter_people(out_boxes[b], out_scores[b], out_classes[b], image_height, image_width))
 
-            if predicted_class == "person" and score > self.score_threshold:
-                box = out_boxes[i]
+        return results
 
-                top, left, bottom, right = box
-                top = max(0, np.floor(top + 0.5).astype('int32'))
-                left = max(0, np.floor(left + 0.5).astype('int32'))
-                bottom = min(image_height, np.floor(bottom + 0.5).astype('int32'))
-                right = min(image_width, np.floor(right + 0.5).astype('int32'))
-                list_of_coords.append((left + i, top + i, right - i, bottom - i))
+    def close(self):
+        """
+        Frees the model, the Keras session is cleared so the next model is built in an empty graph
+        """
+        self.sess.close()
+        K.clear_session()
 
-        return list_of_coords
+    def filter_people(self, out_boxes, out_scores, out_classes, image_height, image_width):
+        return boxes_to_coords(out_boxes, out_scores, out_classes, self.person_class_ids, image_height, image_width,
+                               score_threshold=self.score_threshold, index_offset=self.index_offset)
 
 
 def close_session(self):
@@ -0,0 +1,173 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from gymnoscamera.frame_buffers import LetterboxInput
+from gymnoscamera.yolo_network.postprocess import YoloDecoder, boxes_to_coords
+
+
+class Yolo_v3_dnn:
+    """
+    YOLOv3 or tiny YOLOv3 run on the CPU through OpenCV's DNN module, without
+    Keras or TensorFlow.
+
+    Loads Darknet .cfg/.weights pairs, or ONNX exports. Outputs already
+    decoded into rows of (center x, center y, width, height, objectness,
+    class scores...) relative to the network input, the layout OpenCV's
+    Darknet importer produces, are scored and mapped back here. Raw head
+    feature maps, as exported from the Keras model, go through YoloDecoder.
+    """
+
+    _defaults = {
+        "model_path": None,
+        "config_path": None,  # Darknet .cfg, defaults to the weights path with a .cfg extension
+        "anchors_path": 'model_data/yolo_anchors.txt',  # for raw head outputs of ONNX exports
+        "classes_path": 'model_data/coco_classes.txt',
+        "score": 0.3,
+        "iou": 0.45,
+        "model_image_size": (256, 256),
+        "detect_classes": ("person",),
+    }
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(self._defaults)  # set up default values
+        self.__dict__.update(kwargs)  # and update with user overrides
+
+        if not self.model_path:
+            raise ValueError("Argument 'model_path' must be overridden to use YoloV3 DNN!")
+
+        self.class_names = self._get_class()
+        self.class_ids = np.array([self.class_names.index(name) for name in self.detect_classes])
+        self.person_class_ids = [self.class_names.index("person")]
+
+        self.anchors = self._get_anchors()
+        self.decoder = YoloDecoder(self.anchors, self.class_ids, score_threshold=self.score, iou_threshold=self.iou)
+
+        self.net = self.load_net()
+        self.output_names = self.net.getUnconnectedOutLayersNames()
+
+        # The network takes NCHW, the letterboxed NHWC tensor is transposed into this
+        width, height = self.get_input_size()
+        self.blob = np.empty((1, 3, height, width), dtype=np.float32)
+        self.network_input = None
+
+    def _get_class(self):
+        classes_path = os.path.expanduser(os.path.join(os.path.dirname(__file__), self.classes_path))
+        with open(classes_path) as f:
+            class_names = f.readlines()
+        class_names = [c.strip() for c in class_names]
+
+        return class_names
+
+    def _get_anchors(self):
+        anchors_path = os.path.expanduser(os.path.join(os.path.dirname(__file__), self.anchors_path))
+        with open(anchors_path) as f:
+            anchors = f.readline()
+        anchors = [float(x) for x in anchors.split(',')]
+
+        return np.array(anchors).reshape(-1, 2)
+
+    def load_net(self):
+        model_path = os.path.expanduser(self.model_path)
+        if model_path.endswith('.onnx'):
+            net = cv2.dnn.readNet(model_path)
+        else:
+            config_path = self.config_path or os.path.splitext(model_path)[0] + '.cfg'
+            net = cv2.dnn.readNet(model_path, os.path.expanduser(config_path))
+
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        logging.info('{} model loaded.'.format(model_path))
+
+        return net
+
+    def get_input_size(self):
+        """
+        Returns the (width, height) of the network input
+        """
+        return self.model_image_size[1], self.model_image_size[0]
+
+    def detect_image(self, image, network_input=None):
+        """
+        Finds the people in a frame
+
+        :param image: BGR uint8 frame of any size
+        :param network_input: LetterboxInput to reuse for the network input
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        (image_height, image_width, channels) = image.shape
+
+        if network_input is None:
+            if self.network_input is None:
+                self.network_input = LetterboxInput(*self.get_input_size())
+            network_input = self.network_input
+        image_data = network_input.fill(image)
+
+        np.copyto(self.blob, image_data.transpose(0, 3, 1, 2))
+        self.net.setInput(self.blob)
+        outputs = self.net.forward(self.output_names)
+
+        if outputs[0].ndim == 4:
+            return self.decode_head(outputs, image_height, image_width)
+        return self.decode(outputs, network_input, image_height, image_width)
+
+    def decode_head(self, outputs, image_height, image_width):
+        """
+        Decodes raw head feature maps
+
+        :param outputs: NHWC or NCHW feature maps of each output layer
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        channels = len(self.decoder.anchor_mask[0]) * (5 + len(self.class_names))
+        outputs = [output.transpose(0, 2, 3, 1) if output.shape[-1] != channels else output for output in outputs]
+        # Coarsest grid first, the order the anchor masks are in
+        outputs = sorted(outputs, key=lambda output: output.shape[1])
+
+        out_boxes, out_scores, out_classes = self.decoder.decode(outputs, self.blob.shape[2:4],
+                                                                 (image_height, image_width))
+        return boxes_to_coords(out_boxes, out_scores, out_classes, self.person_class_ids, image_height, image_width)
+
+    def decode(self, outputs, network_input, image_height, image_width):
+        """
+        Scores, suppresses and maps the network's detections back to the frame
+
+        :param outputs: detection rows of each output layer
+        :param network_input: LetterboxInput the frame was letterboxed with
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        rows = np.concatenate([output.reshape(-1, output.shape[-1]) for output in outputs])
+
+        # Best of the requested classes for each detection
+        class_scores = rows[:, 5:][:, self.class_ids]
+        best = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(rows)), best]
+        keep = scores > self.score
+        rows, best, scores = rows[keep], best[keep], scores[keep]
+
+        # Undo the letterbox, network input fractions to frame pixels
+        input_width, input_height = self.get_input_size()
+        rows_region, columns_region = network_input.region
+        scale = (columns_region.stop - columns_region.start) / float(image_width)
+        center_x = (rows[:, 0] * input_width - columns_region.start) / scale
+        center_y = (rows[:, 1] * input_height - rows_region.start) / scale
+        box_width = rows[:, 2] * input_width / scale
+        box_height = rows[:, 3] * input_height / scale
+
+        out_boxes = np.stack([center_y - box_height / 2, center_x - box_width / 2,
+                              center_y + box_height / 2, center_x + box_width / 2], axis=1)
+        nms_boxes = np.stack([center_x - box_width / 2, center_y - box_height / 2, box_width, box_height], axis=1)
+
+        # NMS for each requested class
+        selected = []
+        for i in range(len(self.class_ids)):
+            indices = np.flatnonzero(best == i)
+            if len(indices) == 0:
+                continue
+            kept = cv2.dnn.NMSBoxes(nms_boxes[indices].tolist(), scores[indices].tolist(), self.score, self.iou)
+            selected.append(indices[np.asarray(kept, dtype=np.int64).reshape(-1)])
+        selected = np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64)
+
+        return boxes_to_coords(out_boxes[selected], scores[selected], self.class_ids[best[selected]],
+                               self.person_class_ids, image_height, image_width)
@@ -2,8 +2,8 @@ import tensorflow as tf
 import colorsys
 import numpy as np
 import os
-from gymnoscamera.yolo_network.model import yolo_eval
-from keras import backend as K
+from gymnoscamera.frame_buffers import LetterboxInput, letterbox_batch
+from gymnoscamera.yolo_network.postprocess import YoloDecoder, boxes_to_coords
 
 input_names = ['input_1']
 output_names = ['conv2d_59/BiasAdd', 'conv2d_67/BiasAdd', 'conv2d_75/BiasAdd']
@@ -19,10 +19,14 @@ class Yolo_v3_rt:
         "iou": 0.45,
         "model_image_size": (256, 256),
         "gpu_num": 1,
+        "detect_classes": ("person",),  # None decodes every class
+        "index_offset": False,  # shrink each box by its detection index like the old per-box loop
     }
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         self.__dict__.update(self._defaults)  # set up default values
+        self.__dict__.update(kwargs)  # and update with user overrides
+        self.network_input = None
 
         self.tf_sess = self.load_tf_rt_graph()
 
@@ -34,8 +38,9 @@ class Yolo_v3_rt:
         self.input_tensor = self.tf_sess.graph.get_tensor_by_name('input_1:0')
 
         self.class_names = self._get_class()
+        self.person_class_ids = [self.class_names.index("person")]
         self.anchors = self._get_anchors()
-        self.boxes, self.scores, self.classes = self.generate()
+        self.decoder = self.generate()
 
     def get_frozen_graph(self, graph_file):
         """Read Frozen Graph file from disk."""
@@ -85,43 +90,74 @@ class Yolo_v3_rt:
         np.random.shuffle(self.colors)  # Shuffle colors to decorrelate adjacent classes.
         np.random.seed(None)  # Reset seed to default.
 
-        # Generate output tensor targets for filtered bounding boxes.
-        self.input_image_shape = K.placeholder(shape=(2,))
-
-        boxes, scores, classes = yolo_eval(self.output_tensor, self.anchors,
-                                           len(self.class_names), self.input_image_shape,
-                                           score_threshold=self.score, iou_threshold=self.iou)
-
-        return boxes, scores, classes
-
-    def detect_image(self, image):
-        image_data = np.array(image, dtype='float32')
-
-        (image_height, image_width, channels) = image_data.shape
-
-        image_data /= 255.
-        image_data = np.expand_dims(image_data, 0)  # Add batch dimension.
-
-        out_boxes, out_scores, out_classes = self.tf_sess.run(
-            [self.boxes, self.scores, self.classes],
-            feed_dict={
-                self.input_tensor: image_data,
-                self.input_image_shape: [image_height, image_width],
-            })
-        print(out_boxes.shape)
-        list_of_coords = []
-        for i, c in reversed(list(enumerate(out_classes))):
-            predicted_class = self.class_names[c]
-
-            if predicted_class == "person":
-                box = out_boxes[i]
-
-                top, left, bottom, right = box
-                top = max(0, np.floor(top + 0.5).astype('int32'))
-                left = max(0, np.floor(left + 0.5).astype('int32'))
-                bottom = min(image_height, np.floor(bottom + 0.5).astype('int32'))
-                right = min(image_width, np.floor(right + 0.5).astype('int32'))
-
-                list_of_coords.append((left + i, top + i, right - i, bottom - i))
-
-        return list_of_coords
+        # The raw head outputs are decoded in NumPy, not in a second graph
+        return YoloDecoder(self.anchors, self.get_class_ids(), score_threshold=self.score, iou_threshold=self.iou)
+
+    def get_class_ids(self):
+        """
+        Returns the indices of the classes the decoder decodes, None for all of them
+        """
+        if self.detect_classes is None:
+            return None
+        return [self.class_names.index(name) for name in self.detect_classes]
+
+    def get_input_size(self):
+        """
+        Returns the (width, height) of the network input
+        """
+        return self.model_image_size[1], self.model_image_size[0]
+
+    def detect_image(self, image, network_input=None):
+        """
+        Finds the people in a frame
+
+        :param image: BGR uint8 frame of any size
+        :param network_input: LetterboxInput to reuse for the network input
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        (image_height, image_width, channels) = image.shape
+
+        if network_input is None:
+            if self.network_input is None:
+                self.network_input = LetterboxInput(*self.get_input_size())
+            network_input = self.network_input
+        image_data = network_input.fill(image)
+
+        feats = self.tf_sess.run(self.output_tensor, feed_dict={self.input_tensor: image_data})
+        out_boxes, out_scores, out_classes = self.decoder.decode(feats, image_data.shape[1:3],
+                                                                 (image_height, image_width))
+
+        return self.filter_people(out_boxes, out_classes, image_height, image_width)
+
+    def detect_images(self, images, letterbox=True):
+        """
+        Runs the network once over a batch of images
+
+        :param images: list of BGR uint8 frames
+        :param letterbox: letterbox the frames to the network input size, so they can differ in size,
+                          otherwise they are used at their own size which has to be the same for every
+                          frame and a multiple of 32
+        :return: (N, 4) int32 array of coordinates for each frame
+        """
+        if letterbox:
+            image_data = letterbox_batch(images, *self.get_input_size())
+        else:
+            (image_height, image_width, channels) = images[0].shape
+            image_data = letterbox_batch(images, image_width, image_height)
+        image_shapes = [image.shape[:2] for image in images]
+
+        feats = self.tf_sess.run(self.output_tensor, feed_dict={self.input_tensor: image_data})
+
+        # Decode each image from its slice of the feature maps
+        results = []
+        for b, (image_height, image_width) in enumerate(image_shapes):
+            out_boxes, out_scores, out_classes = self.decoder.decode([feat[b:b + 1] for feat in feats],
+                                                                     image_data.shape[1:3],
+                                                                     (image_height, image_width))
+            results.append(self.filter_people(out_boxes, out_classes, image_height, image_width))
+
+        return results
+
+    def filter_people(self, out_boxes, out_classes, image_height, image_width):
+        return boxes_to_coords(out_boxes, None, out_classes, self.person_class_ids, image_height, image_width,
+                               index_offset=self.index_offset)
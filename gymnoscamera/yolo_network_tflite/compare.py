@@ -0,0 +1,158 @@
+"""
+Compares an exported TFLite model with the float Keras model it came from.
+
+Both models run over the same frames. Latency is measured per frame and
+the float model's people are taken as the reference the quantized model's
+are matched against. The report is written as Markdown.
+
+    python3 -m gymnoscamera.yolo_network_tflite.compare --float-model yolo.h5 --quantized-model yolo_int8.tflite \
+        --frames frames/ --report quantization_report.md
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from gymnoscamera.yolo_network.postprocess import box_ious
+from gymnoscamera.yolo_network_tflite.export import parse_size, read_frames
+
+MATCH_IOU = 0.5
+
+
+def match_people(reference, candidates, threshold: float = MATCH_IOU):
+    """
+    Greedily matches people found by two models, best overlaps first
+
+    :return: IoUs of the matched pairs
+    """
+    if len(reference) == 0 or len(candidates) == 0:
+        return []
+
+    ious = box_ious(reference, candidates)
+    matched = []
+    while True:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[i, j] < threshold:
+            return matched
+        matched.append(float(ious[i, j]))
+        ious[i, :] = -1
+        ious[:, j] = -1
+
+
+def time_predictions(predictor, frames):
+    """
+    Runs a predictor over every frame
+
+    :return: (list of people coordinates, list of seconds taken)
+    """
+    # The first run includes one-off setup
+    predictor.run_prediction(frames[0])
+
+    results = []
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        results.append(predictor.run_prediction(frame))
+        latencies.append(time.perf_counter() - start)
+
+    return results, latencies
+
+
+def latency_row(name, model_path, latencies, results):
+    milliseconds = np.array(latencies) * 1000
+    return "| {} | {:.1f} | {:.1f} | {:.1f} | {:.1f} | {:.1f} | {} |".format(
+        name, os.path.getsize(model_path) / 1e6, milliseconds.mean(), np.percentile(milliseconds, 50),
+        np.percentile(milliseconds, 95), 1000 / milliseconds.mean(), sum(len(people) for people in results))
+
+
+def compare(float_model: str, quantized_model: str, frames_path: str, input_size: tuple = None,
+            limit: int = 200):
+    """
+    Compares the accuracy and latency of the quantized model against the float model
+
+    :param float_model: path to the Keras .h5 model
+    :param quantized_model: path to the .tflite model
+    :param frames_path: directory of images or a video to compare on
+    :param input_size: (width, height) of the float model's input, defaults to the quantized model's
+    :param limit: most frames to compare on
+    :return: the report as Markdown
+    """
+    from gymnoscamera import predictors
+
+    frames = list(read_frames(frames_path, limit))
+    if not frames:
+        raise ValueError("No frames found in '{}'".format(frames_path))
+
+    quantized = predictors.Predictors('YOLOV3TFLITE', quantized_model)
+    input_size = input_size or quantized.get_input_size()
+    quantized_results, quantized_latencies = time_predictions(quantized, frames)
+
+    float_predictor = predictors.Predictors('YOLOV3', float_model, input_size)
+    float_results, float_latencies = time_predictions(float_predictor, frames)
+
+    matched = []
+    reference_count = 0
+    candidate_count = 0
+    for reference, candidates in zip(float_results, quantized_results):
+        matched.extend(match_people(reference, candidates))
+        reference_count += len(reference)
+        candidate_count += len(candidates)
+
+    recall = len(matched) / reference_count if reference_count else 1.0
+    precision = len(matched) / candidate_count if candidate_count else 1.0
+    mean_iou = np.mean(matched) if matched else 0.0
+
+    lines = [
+        "# Quantized model report",
+        "",
+        "{} frames from `{}` at a {}x{} network input.".format(len(frames), frames_path, *input_size),
+        "",
+        "## Latency",
+        "",
+        "| Model | Size (MB) | Mean (ms) | p50 (ms) | p95 (ms) | FPS | People found |",
+        "| --- | --- | --- | --- | --- | --- | --- |",
+        latency_row("float (`{}`)".format(os.path.basename(float_model)), float_model, float_latencies,
+                    float_results),
+        latency_row("int8 (`{}`)".format(os.path.basename(quantized_model)), quantized_model, quantized_latencies,
+                    quantized_results),
+        "",
+        "## Accuracy against the float model",
+        "",
+        "People are matched at IoU >= {}.".format(MATCH_IOU),
+        "",
+        "| Recall | Precision | Mean IoU of matches |",
+        "| --- | --- | --- |",
+        "| {:.3f} | {:.3f} | {:.3f} |".format(recall, precision, mean_iou),
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a quantized TFLite model with its float Keras model')
+    parser.add_argument('--float-model', help='A file path to the Keras .h5 model',
+                        action='store', required=True)
+    parser.add_argument('--quantized-model', help='A file path to the .tflite model',
+                        action='store', required=True)
+    parser.add_argument('--frames', help='A directory of gym frames or a video to compare on',
+                        action='store', required=True)
+    parser.add_argument('--input-size', help='Size of the float network input, defaults to the quantized one',
+                        action='store')
+    parser.add_argument('--limit', help='Most frames to compare on',
+                        action='store', type=int, default=200)
+    parser.add_argument('--report', help='Where to write the Markdown report, printed if not given',
+                        action='store')
+    args = parser.parse_args()
+
+    input_size = parse_size(args.input_size) if args.input_size else None
+    report = compare(args.float_model, args.quantized_model, args.frames, input_size, args.limit)
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            report_file.write(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
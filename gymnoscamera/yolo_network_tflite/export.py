@@ -0,0 +1,154 @@
+"""
+Exports a Keras YOLOv3 or tiny YOLOv3 model to an int8 quantized TFLite model.
+
+Weights are quantized after training, activations are calibrated on a set
+of gym frames (a directory of images or a video) letterboxed the same way
+the cameras do it. The network input size is fixed at export.
+
+    python3 -m gymnoscamera.yolo_network_tflite.export --model yolo.h5 --calibration frames/ --output yolo_int8.tflite
+"""
+import argparse
+import glob
+import logging
+import os
+import tempfile
+
+import cv2
+
+from gymnoscamera.frame_buffers import LetterboxInput
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def read_frames(path: str, limit: int = None):
+    """
+    Reads frames from a directory of images or a video file
+
+    :param path: directory or video file
+    :param limit: most frames to read, None reads all of them
+    :return: generator of BGR uint8 frames
+    """
+    count = 0
+    if os.path.isdir(path):
+        files = sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for frame_file in files:
+            if limit is not None and count >= limit:
+                return
+            image = cv2.imread(frame_file)
+            if image is not None:
+                count += 1
+                yield image
+    else:
+        capture = cv2.VideoCapture(path)
+        try:
+            while limit is None or count < limit:
+                ret, image = capture.read()
+                if not ret:
+                    return
+                count += 1
+                yield image
+        finally:
+            capture.release()
+
+
+def load_keras_model(model_path: str, input_size: tuple, anchors_count: int, num_classes: int):
+    """
+    Loads a Keras YOLO model with a fixed input size, TFLite needs static shapes
+
+    :param model_path: .h5 model or weights
+    :param input_size: (width, height) of the network input
+    :param anchors_count: 9 for YOLOv3, 6 for tiny YOLOv3
+    :param num_classes: number of classes the model was trained on
+    :return: the model
+    """
+    from keras.layers import Input
+    from gymnoscamera.yolo_network.model import yolo_body, tiny_yolo_body
+
+    (width, height) = input_size
+    inputs = Input(shape=(height, width, 3))
+    if anchors_count == 6:
+        model = tiny_yolo_body(inputs, anchors_count // 2, num_classes)
+    else:
+        model = yolo_body(inputs, anchors_count // 3, num_classes)
+
+    # Full models and weights files both load into the fixed size body
+    model.load_weights(os.path.expanduser(model_path))
+    return model
+
+
+def export(model_path: str, calibration_path: str, output_path: str, input_size: tuple = (256, 256),
+           tiny: bool = False, num_classes: int = 80, calibration_frames: int = 100):
+    """
+    Exports a Keras YOLO model to an int8 TFLite model
+
+    :param model_path: .h5 model or weights
+    :param calibration_path: directory of images or a video to calibrate the activations on
+    :param output_path: where to write the .tflite model
+    :param input_size: (width, height) of the network input
+    :param tiny: the model is tiny YOLOv3
+    :param num_classes: number of classes the model was trained on
+    :param calibration_frames: most frames to calibrate on
+    :return: size of the exported model in bytes
+    """
+    import tensorflow as tf
+
+    model = load_keras_model(model_path, input_size, 6 if tiny else 9, num_classes)
+
+    network_input = LetterboxInput(*input_size)
+
+    def representative_dataset():
+        for image in read_frames(calibration_path, calibration_frames):
+            yield [network_input.fill(image)]
+
+    # The converter of this TensorFlow version takes a saved model file
+    with tempfile.TemporaryDirectory() as temp_dir:
+        keras_path = os.path.join(temp_dir, 'model.h5')
+        model.save(keras_path)
+        converter = tf.lite.TFLiteConverter.from_keras_model_file(keras_path)
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        tflite_model = converter.convert()
+
+    with open(output_path, 'wb') as output_file:
+        output_file.write(tflite_model)
+
+    logging.info("Exported {} to {} ({} bytes)".format(model_path, output_path, len(tflite_model)))
+    return len(tflite_model)
+
+
+def parse_size(size: str):
+    """
+    Parses WIDTHxHEIGHT, or one number for a square
+    """
+    if 'x' in size:
+        width, height = size.split('x')
+        return int(width), int(height)
+    return int(size), int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a Keras YOLO model to int8 TFLite')
+    parser.add_argument('--model', help='A file path to the Keras .h5 model or weights',
+                        action='store', required=True)
+    parser.add_argument('--calibration', help='A directory of gym frames or a video to calibrate on',
+                        action='store', required=True)
+    parser.add_argument('--output', help='Where to write the .tflite model',
+                        action='store', required=True)
+    parser.add_argument('--input-size', help='Size of the network input, WIDTHxHEIGHT or one number for a square',
+                        action='store', default='256')
+    parser.add_argument('--tiny', help='The model is tiny YOLOv3',
+                        action='store_true')
+    parser.add_argument('--calibration-frames', help='Most frames to calibrate on',
+                        action='store', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    size = export(args.model, args.calibration, args.output, parse_size(args.input_size), args.tiny,
+                  calibration_frames=args.calibration_frames)
+    print("Wrote {} ({:.1f} MB)".format(args.output, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
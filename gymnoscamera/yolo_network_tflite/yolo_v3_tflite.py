@@ -0,0 +1,160 @@
+import logging
+import os
+
+import numpy as np
+
+from gymnoscamera.frame_buffers import LetterboxInput
+from gymnoscamera.yolo_network.postprocess import YoloDecoder, boxes_to_coords
+
+
+def load_interpreter(model_path: str, num_threads: int = None):
+    """
+    Loads a TFLite model, preferring the small tflite_runtime package over
+    the full TensorFlow install
+
+    :param model_path: path to the .tflite model
+    :param num_threads: threads the interpreter may use, None lets it decide
+    :return: the interpreter with its tensors allocated
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+
+    try:
+        interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+    except TypeError:
+        # Older interpreters have no num_threads
+        interpreter = Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+
+    return interpreter
+
+
+class Yolo_v3_tflite:
+    """
+    YOLOv3 or tiny YOLOv3 exported to TFLite, usually int8 quantized by
+    gymnoscamera.yolo_network_tflite.export, for the Pi.
+
+    The interpreter only runs the backbone, the raw head outputs are decoded
+    in NumPy. The network input size is fixed when the model is exported.
+    Models with quantized inputs or outputs are quantized and dequantized
+    here.
+    """
+
+    _defaults = {
+        "model_path": None,
+        "anchors_path": 'model_data/yolo_anchors.txt',
+        "tiny_anchors_path": 'model_data/tiny_yolo_anchors.txt',  # used for tiny models unless anchors_path is set
+        "classes_path": 'model_data/coco_classes.txt',
+        "score": 0.3,
+        "iou": 0.45,
+        "num_threads": None,
+        "detect_classes": ("person",),
+    }
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(self._defaults)  # set up default values
+        self.__dict__.update(kwargs)  # and update with user overrides
+
+        if not self.model_path:
+            raise ValueError("Argument 'model_path' must be overridden to use YoloV3 TFLite!")
+
+        self.class_names = self._get_class()
+        self.class_ids = [self.class_names.index(name) for name in self.detect_classes]
+        self.person_class_ids = [self.class_names.index("person")]
+
+        self.interpreter = load_interpreter(os.path.expanduser(self.model_path), self.num_threads)
+        self.input_details = self.interpreter.get_input_details()[0]
+        # Coarsest grid first, the order the anchor masks are in
+        self.output_details = sorted(self.interpreter.get_output_details(), key=lambda details: details['shape'][1])
+
+        # Full models have three outputs and tiny ones two, each with three anchors
+        if 'anchors_path' not in kwargs and len(self.output_details) == 2:
+            self.anchors_path = self.tiny_anchors_path
+        self.anchors = self._get_anchors()
+        if len(self.anchors) != 3 * len(self.output_details):
+            raise ValueError("{} anchors do not fit a model with {} outputs, set anchors_path"
+                             .format(len(self.anchors), len(self.output_details)))
+        self.decoder = YoloDecoder(self.anchors, self.class_ids, score_threshold=self.score, iou_threshold=self.iou)
+
+        self.network_input = None
+        self.quantized_input = None
+        if self.input_details['dtype'] != np.float32:
+            self.quantized_input = np.empty(self.input_details['shape'], dtype=self.input_details['dtype'])
+
+        logging.info('{} model loaded.'.format(self.model_path))
+
+    def _get_class(self):
+        classes_path = os.path.expanduser(os.path.join(os.path.dirname(__file__), self.classes_path))
+        with open(classes_path) as f:
+            class_names = f.readlines()
+        class_names = [c.strip() for c in class_names]
+
+        return class_names
+
+    def _get_anchors(self):
+        anchors_path = os.path.expanduser(os.path.join(os.path.dirname(__file__), self.anchors_path))
+        with open(anchors_path) as f:
+            anchors = f.readline()
+        anchors = [float(x) for x in anchors.split(',')]
+
+        return np.array(anchors).reshape(-1, 2)
+
+    def get_input_size(self):
+        """
+        Returns the (width, height) of the network input
+        """
+        (batch, height, width, channels) = self.input_details['shape']
+        return int(width), int(height)
+
+    def set_input(self, image_data):
+        """
+        Feeds the letterboxed float tensor, quantizing it if the model takes integers
+        """
+        if self.quantized_input is None:
+            self.interpreter.set_tensor(self.input_details['index'], image_data)
+            return
+
+        scale, zero_point = self.input_details['quantization']
+        np.copyto(self.quantized_input, np.round(image_data / scale + zero_point), casting='unsafe')
+        self.interpreter.set_tensor(self.input_details['index'], self.quantized_input)
+
+    def get_outputs(self):
+        """
+        Returns the raw head outputs as float, dequantizing them if needed
+        """
+        outputs = []
+        for details in self.output_details:
+            output = self.interpreter.get_tensor(details['index'])
+            if details['dtype'] != np.float32:
+                scale, zero_point = details['quantization']
+                output = (output.astype(np.float32) - zero_point) * scale
+            outputs.append(output)
+
+        return outputs
+
+    def detect_image(self, image, network_input=None):
+        """
+        Finds the people in a frame
+
+        :param image: BGR uint8 frame of any size
+        :param network_input: LetterboxInput to reuse for the network input
+        :return: (N, 4) int32 array of coordinates in the frame
+        """
+        (image_height, image_width, channels) = image.shape
+
+        if network_input is None or (network_input.width, network_input.height) != self.get_input_size():
+            if self.network_input is None:
+                self.network_input = LetterboxInput(*self.get_input_size())
+            network_input = self.network_input
+
+        self.set_input(network_input.fill(image))
+        self.interpreter.invoke()
+
+        input_width, input_height = self.get_input_size()
+        out_boxes, out_scores, out_classes = self.decoder.decode(
+            self.get_outputs(), (input_height, input_width), (image_height, image_width))
+
+        return boxes_to_coords(out_boxes, out_scores, out_classes, self.person_class_ids, image_height, image_width)
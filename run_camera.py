@@ -8,14 +8,13 @@ from gymnos_firestore import gyms, machines, usage
 from matchbox import database
 from matchbox.queries.error import DocumentDoesNotExists
 
+from gymnoscamera import autotune, predictors, status_publisher, usage_writer
 from gymnoscamera.cameras import camera_factory
 from gymnoscamera.cameras import CalibrateCam
+from gymnoscamera.cameras.camera_host import CameraHost
+from gymnoscamera.cameras.replay_camera_runner import ReplayFinished
 
-model_types = [
-    'HOG',
-    'YOLOV3',
-    'YOLOV3RT'
-]
+model_types = list(predictors.detectors)
 
 log_location = expanduser("~") + '/logs/gymnos_camera'
 try:
@@ -44,24 +43,107 @@ def parse_args():
                         action='store')
     parser.add_argument('--model-location', help='A file path to a model file',
                         action='store', required=True)
-    parser.add_argument('--model-type', help='Choose from [HOG, YOLOV3, YOLOV3RT]',
+    parser.add_argument('--model-type', help='Choose from [{}]'.format(', '.join(model_types)),
                         action='store')
+    parser.add_argument('--capture-size', help='Size of the frames to capture, WIDTHxHEIGHT (default 256x256)',
+                        action='store')
+    parser.add_argument('--input-size', help='Size of the network input, WIDTHxHEIGHT or one number for a square',
+                        action='store')
+    parser.add_argument('--autotune', help='Pick the fastest model and input size which is accurate enough on this box, '
+                                           'reusing the last choice if nothing changed',
+                        action='store_true')
+    parser.add_argument('--autotune-models', help='Other model files to consider when autotuning, comma separated',
+                        action='store')
+    parser.add_argument('--autotune-frames', help='A directory of frames or a video to autotune on, '
+                                                  'frames are taken from the camera if not given',
+                        action='store')
+    parser.add_argument('--latency-budget', help='Most milliseconds a frame may take when autotuning (default 200)',
+                        action='store', type=float, default=200)
+    parser.add_argument('--accuracy-target', help='Least F1 against the largest model when autotuning (default 0.9)',
+                        action='store', type=float, default=0.9)
     parser.add_argument('--usbcam', help='Use a USB webcam instead of picamera',
                         action='store_true')
     parser.add_argument('--ipcam', help='Use an IP webcam',
                         action='store_true')
+    parser.add_argument('--cameras-config', help='A file path to a config of several cameras to run with one model',
+                        action='store')
+    parser.add_argument('--replay', help='Replay a video file or a directory of frames instead of a camera',
+                        action='store')
+    parser.add_argument('--replay-real-time', help='Replay frames at the pace they were recorded at',
+                        action='store_true')
+    parser.add_argument('--capture-process', help='Capture frames in a separate process over shared memory',
+                        action='store_true')
     parser.add_argument('--mac', help='Using a mac',
                         action='store_true')
     parser.add_argument('--headless', help='Run the algorithm without GUI',
                         action='store_true')
     parser.add_argument('--view-only', help='View camera without running algorithm',
                         action='store_true')
+    parser.add_argument('--pipelined', help='Run capture, inference and accounting on separate threads',
+                        action='store_true')
+    parser.add_argument('--motion-gated', help='Skip the model on frames where no station changed',
+                        action='store_true')
+    parser.add_argument('--track', help='Track people between detections and only run the model every few frames',
+                        action='store_true')
+    parser.add_argument('--result-cache', help='Reuse the people found on earlier frames for frames which look the same',
+                        action='store_true')
+    parser.add_argument('--cache-distance', help='Most bits of the 256 bit frame hash that may differ '
+                                                 'for a cached result to be reused (default 8)',
+                        action='store', type=int, default=8)
+    parser.add_argument('--cache-max-age', help='Seconds a cached result is reused for (default 60)',
+                        action='store', type=float, default=60)
+    parser.add_argument('--roi', help='Only run the model on the regions around the stations',
+                        action='store_true')
+    parser.add_argument('--roi-native', help='Crop the station regions at the resolution the camera captures at',
+                        action='store_true')
+    parser.add_argument('--check-allocations', help='Measure the memory the frame path allocates and exit',
+                        action='store_true')
     parser.add_argument('--production', help='Uses production database',
                         action='store_true')
 
     return parser.parse_args()
 
 
+def parse_size(size: str) -> tuple:
+    """
+    Parses a size given as 'WIDTHxHEIGHT' or a single number for a square
+
+    :return: (width, height)
+    """
+    if not size:
+        return None
+
+    parts = size.lower().split('x')
+    if len(parts) == 1:
+        parts = parts * 2
+
+    return int(parts[0]), int(parts[1])
+
+
+def get_autotuned_predictor(args, model_type: str, model_path: str, get_frame) -> predictors.Predictors:
+    """
+    Loads the model and input size the autotuner picks for this box
+
+    :param get_frame: the camera's get_frame, for frames to tune on
+    :return: the loaded predictor
+    """
+    model_paths = [model_path]
+    if args.autotune_models:
+        model_paths += [os.path.abspath(path) for path in args.autotune_models.split(',')]
+
+    tuner = autotune.AutoTuner(model_type, model_paths, latency_budget=args.latency_budget / 1000,
+                               accuracy_target=args.accuracy_target)
+
+    def get_frames():
+        if args.autotune_frames:
+            from gymnoscamera.yolo_network_tflite.export import read_frames
+            return list(read_frames(os.path.abspath(args.autotune_frames), limit=30))
+        return autotune.capture_frames(get_frame)
+
+    operating_point = tuner.get_operating_point(get_frames)
+    return predictors.Predictors(operating_point.model_type, operating_point.model_path, operating_point.input_size)
+
+
 def get_gym(gym_name: str = None, gym_location: str = None) -> gyms.Gyms:
 
     if not gym_name:
@@ -106,13 +188,22 @@ def main():
     service_account = os.path.expanduser(os.path.join(os.path.dirname(__file__), service_file))
     database.db_initialization(service_account)
 
-    if args.usbcam:
+    camera_args = {'capture_size': parse_size(args.capture_size)}
+    if args.replay:
+        camera_type = 'replay'
+        camera_args.update(source=os.path.abspath(args.replay), real_time=args.replay_real_time)
+    elif args.usbcam:
         camera_type = 'usb'
     elif args.ipcam:
         camera_type = 'ip'
     else:
         camera_type = 'pi'
 
+    if args.capture_process:
+        camera_args = {'capture_size': camera_args.pop('capture_size'),
+                       'source_type': camera_type, 'source_args': camera_args}
+        camera_type = 'bus'
+
     model_type = args.model_type
     if model_type not in model_types:
         raise ValueError('Use one of the following Model types: ' + str(model_types))
@@ -130,8 +221,41 @@ def main():
     usage.Usage._meta.collection_name = "{}/{}/{}".format(
         gyms.Gyms.collection_name(), gym.id, usage.Usage.collection_name())
 
-    # Get the selected camera
-    camera = camera_factory.factory.get_camera(camera_type, model_type, model_path)
+    if args.cameras_config:
+        if args.configure:
+            raise ValueError('Configure one camera at a time, without --cameras-config')
+        if args.autotune:
+            raise ValueError('Autotune one camera at a time, without --cameras-config')
+
+        host = CameraHost(os.path.abspath(args.cameras_config), model_type, model_path)
+        if args.headless:
+            host.set_headless()
+        if args.view_only:
+            host.set_view_only()
+        if args.motion_gated:
+            host.set_motion_gated()
+        if args.track:
+            host.set_tracking()
+        if args.result_cache:
+            host.set_result_cache(args.cache_distance, args.cache_max_age)
+        try:
+            host.run_loop()
+        finally:
+            # Write the sessions and statuses still waiting before exiting
+            usage_writer.writer.stop()
+            status_publisher.publisher.stop()
+        return
+
+    if args.autotune:
+        # Only capture until the model is chosen
+        camera = camera_factory.factory.get_camera(camera_type, None, model_path, **camera_args)
+        camera.set_predictor(get_autotuned_predictor(args, model_type, model_path, camera.get_frame))
+    else:
+        # Load the model with the requested input size
+        camera_args['predictor'] = predictors.Predictors(model_type, model_path, parse_size(args.input_size))
+
+        # Get the selected camera
+        camera = camera_factory.factory.get_camera(camera_type, model_type, model_path, **camera_args)
 
     if args.headless:
         camera.set_headless()
@@ -139,12 +263,42 @@ def main():
     if args.view_only:
         camera.set_view_only()
 
-    if args.configure:
-        # TODO: Add option to read from gymnos_info.json file to retrieve machines locally instead of querying the DB.
-        calibrate = CalibrateCam.CalibrateCam(camera, args.mac)
-        calibrate.main()
-    else:
-        camera.run_loop()
+    if args.motion_gated:
+        camera.set_motion_gated()
+
+    if args.track:
+        camera.set_tracking()
+
+    if args.roi or args.roi_native:
+        camera.set_roi_inference(args.roi_native)
+
+    if args.result_cache:
+        camera.set_result_cache(args.cache_distance, args.cache_max_age)
+
+    if args.pipelined:
+        camera.set_pipelined()
+
+    try:
+        if args.check_allocations:
+            peak, retained = camera.check_frame_allocations()
+            print("Frame path allocates at most {} bytes at once, retaining {:.1f} bytes per frame"
+                  .format(peak, retained))
+        elif args.configure:
+            # TODO: Add option to read from gymnos_info.json file to retrieve machines locally instead of querying the DB.
+            calibrate = CalibrateCam.CalibrateCam(camera, args.mac)
+            calibrate.main()
+        else:
+            try:
+                camera.run_loop()
+            except ReplayFinished as e:
+                logging.info("Finished replaying " + str(e))
+            finally:
+                # Write the sessions and statuses still waiting before exiting
+                usage_writer.writer.stop()
+                status_publisher.publisher.stop()
+    finally:
+        # Stops a capture process and frees its shared memory
+        camera.close()
 
 
 if __name__ == '__main__':
@@ -6,10 +6,12 @@ setup(
     license='Creative Commons Attribution-Noncommercial-Share Alike license',
     long_description=open('README.md').read(),
 
-    packages=['gymnoscamera', 'gymnoscamera.yolo_network',
-              'gymnoscamera.Widgets', 'gymnoscamera.cameras'],
+    packages=['gymnoscamera', 'gymnoscamera.yolo_network', 'gymnoscamera.yolo_network_dnn',
+              'gymnoscamera.yolo_network_tflite', 'gymnoscamera.Widgets', 'gymnoscamera.cameras'],
     package_data={
         'gymnoscamera.yolo_network': ['model_data/*txt'],
+        'gymnoscamera.yolo_network_dnn': ['model_data/*txt'],
+        'gymnoscamera.yolo_network_tflite': ['model_data/*txt'],
     },
 
     install_requires=[